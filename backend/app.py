@@ -1,53 +1,429 @@
 import logging
+import os
+import sys
 import jwt
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, current_app, request, jsonify, Response, stream_with_context, g, has_request_context
+from flask.json.provider import DefaultJSONProvider
 from flask_bcrypt import Bcrypt
-from flask_jwt_extended import JWTManager, create_access_token, get_jwt_identity, jwt_required, get_jwt, get_jwt_identity
-from sqlalchemy import Column, Integer, String, Boolean, create_engine, ForeignKey, Date, and_
+from flask_jwt_extended import JWTManager, create_access_token, get_jwt_identity, jwt_required, get_jwt
+from sqlalchemy import Column, Integer, String, Boolean, create_engine, ForeignKey, Date, DateTime, Index, and_, or_, insert, update, case, text, bindparam, table, column, literal_column, func, cast, event, select
 from sqlalchemy.orm import sessionmaker, declarative_base, scoped_session
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, StaticPool
+from sqlalchemy.schema import CreateColumn
 from flask_cors import CORS, cross_origin
 from werkzeug.utils import secure_filename
-from datetime import datetime, timedelta
-from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from datetime import date, datetime, timedelta
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError, OperationalError
 import re
-
-app = Flask(__name__)
-CORS(app)
-
-# logging.basicConfig(level=logging.INFO)
-# logging.getLogger('sqlalchemy.engine').setLevel(logging.ERROR)
-# logging.getLogger('sqlalchemy.orm').setLevel(logging.ERROR)
-# logging.getLogger('werkzeug').setLevel(logging.ERROR)
-
-logging.basicConfig(
-    filename='app.log',
-    filemode='a',
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-
-
-logging.getLogger('sqlalchemy.engine').setLevel(logging.ERROR)
-logging.getLogger('sqlalchemy.orm').setLevel(logging.ERROR)
-logging.getLogger('werkzeug').setLevel(logging.ERROR)
+import io
+import csv
+import gzip
+import json
+import click
+import time
+import hashlib
+import asyncio
+import inspect
+import threading
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import cProfile
+import queue
+import atexit
+from functools import wraps
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Defaults for every app built by create_app(); pass a dict to override any of them,
+# e.g. create_app({"DATABASE_URL": "sqlite://", "AUTO_MIGRATE": True}) for a throwaway database.
+DEFAULT_CONFIG = {
+    "DATABASE_URL": os.environ.get("DATABASE_URL", "sqlite:///library.db"),
+    # create or upgrade the schema while building the app; otherwise run `flask --app app migrate-db`
+    "AUTO_MIGRATE": False,
+    "LOG_FILE": os.environ.get("LOG_FILE", "app.log"),
+    "JWT_ACCESS_TOKEN_EXPIRES": timedelta(minutes=180),
+    "JWT_REFRESH_TOKEN_EXPIRES": timedelta(days=7),
+    "JWT_TOKEN_LOCATION": ["headers"],
+    "JWT_COOKIE_SECURE": False,
+    "JWT_COOKIE_CSRF_PROTECT": False,
+    "JWT_SECRET_KEY": 'your-very-secret-key',
+    "RESPONSE_CACHE_MAX_ENTRIES": 256,
+    "RESPONSE_CACHE_TTL": 300,
+    # /findBook and /findCustomer rank at most this many matches (the lowest ids), so a short
+    # prefix matching a large share of the table stays fast; None ranks every match
+    "SEARCH_RANK_CANDIDATES": 2000,
+    "OVERDUE_SWEEP_INTERVAL": 3600,
+    # returned loans older than this move from loans to loan_history, LOAN_ARCHIVE_BATCH_SIZE rows per transaction
+    "LOAN_ARCHIVE_AFTER_DAYS": 365,
+    "LOAN_ARCHIVE_BATCH_SIZE": 5000,
+    "LOAN_ARCHIVE_INTERVAL": 86400,
+    "BCRYPT_LOG_ROUNDS": 12,
+    # how long a process trusts its last read of identity_version before checking for revocations
+    "IDENTITY_VERSION_TTL": 1.0,
+    "HASH_POOL_WORKERS": 4,
+    "HASH_POOL_MAX_QUEUE": 16,
+    "HASH_POOL_RETRY_AFTER": 2,
+    "METRICS_LATENCY_BUCKETS": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+    "PROFILE_SLOW_REQUEST_MS": None,
+    "PROFILE_DIR": "profiles",
+    "EVENT_QUEUE_SIZE": 256,
+    "EVENT_REPLAY_SIZE": 1024,
+    "EVENT_MAX_SUBSCRIBERS": 100,
+    "EVENT_KEEPALIVE": 15,
+    # "orjson" when it is installed, otherwise the standard library encoder; see JSON_PROVIDERS
+    "JSON_SERIALIZER": "orjson",
+    # responses at least this large are gzip/brotli encoded when the client accepts it
+    "COMPRESS_MIN_SIZE": 1024,
+    "COMPRESS_LEVEL": 5,
+    "COMPRESS_MIMETYPES": ("application/json", "application/x-ndjson", "text/csv", "text/plain"),
+    # aiosqlite connections of the async read views (asgi.py), and how long a request may wait
+    # for one before it is shed with 503
+    "ASYNC_DB_POOL_SIZE": 8,
+    "ASYNC_DB_WAIT_TIMEOUT": 10,
+    "ASYNC_DB_RETRY_AFTER": 2,
+}
+
+bp = Blueprint("library", __name__, cli_group=None)
+
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+# keep 1 in N of these high-volume info lines
+LOG_SAMPLE_RATES = {
+    "Fetched all active loans": 100,
+    "Fetched all late loans": 100,
+    "Guest watch list accessed": 100,
+    "find book succeded!": 100,
+    "Invalidated response cache tag: %s": 20,
+}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "sample_rate", None):
+            entry["sample_rate"] = record.sample_rate
+        if record.exc_info:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        rate = self.rates.get(record.msg) if record.levelno <= logging.INFO else None
+        if not rate:
+            return True
+        with self._lock:
+            seen = self._seen.get(record.msg, 0)
+            self._seen[record.msg] = seen + 1
+        record.sample_rate = rate
+        return seen % rate == 0
+
+class LazyQueueHandler(QueueHandler):
+    # the stock handler formats the message on the calling thread; leave that to the listener
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def build_log_pipeline(path, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT, sample_rates=LOG_SAMPLE_RATES):
+    file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+    file_handler.setFormatter(JsonFormatter())
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rates))
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    return queue_handler, listener
+
+log_pipeline = None
+
+def configure_logging(app):
+    # one pipeline per process, however many apps are created in it
+    global log_pipeline
+    if log_pipeline is not None:
+        return
+    log_handler, log_listener = build_log_pipeline(app.config["LOG_FILE"])
+    logging.getLogger().setLevel(logging.INFO)
+    logging.getLogger().addHandler(log_handler)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+    log_pipeline = (log_handler, log_listener)
+
+    logging.getLogger('sqlalchemy.engine').setLevel(logging.ERROR)
+    logging.getLogger('sqlalchemy.orm').setLevel(logging.ERROR)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
 
 logger = logging.getLogger("my log")
 
-DATABASE_URL = "sqlite:///library.db"
-engine = create_engine(DATABASE_URL, echo=False, pool_size=10, max_overflow=20, pool_timeout=30)
-SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
+SQLITE_PRAGMAS = {
+    "busy_timeout": 5000,
+    "synchronous": "NORMAL",
+    "mmap_size": 268435456,
+    "cache_size": -64000,
+    "temp_store": "MEMORY",
+}
+
+def apply_sqlite_pragmas(engine, readonly=False):
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not readonly:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        if readonly:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+def is_memory_url(url):
+    return make_url(url).database in (None, "", ":memory:")
+
+class Database:
+    # the engines and sessions of one app, kept in app.extensions["db"]
+    def __init__(self, url):
+        if is_memory_url(url):
+            # every new connection to :memory: is a new empty database, so share a single one
+            self.engine = create_engine(url, echo=False, poolclass=StaticPool, connect_args={"check_same_thread": False})
+            self.read_engine = self.engine
+            apply_sqlite_pragmas(self.engine)
+        else:
+            # SQLite allows a single writer, so the write pool is kept small; with WAL the
+            # readers get their own pool and never wait behind it.
+            self.engine = create_engine(url, echo=False, pool_size=4, max_overflow=4, pool_timeout=30)
+            self.read_engine = create_engine(url, echo=False, pool_size=10, max_overflow=20, pool_timeout=30)
+            apply_sqlite_pragmas(self.engine)
+            apply_sqlite_pragmas(self.read_engine, readonly=True)
+        for instrumented_engine in {self.engine, self.read_engine}:
+            event.listen(instrumented_engine, "before_cursor_execute", start_query_timer)
+            event.listen(instrumented_engine, "after_cursor_execute", stop_query_timer)
+        self.session = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=self.engine))
+        self.read_session = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=self.read_engine))
+        self.search_enabled = False
+        open_databases.add(self)
+
+    def remove_sessions(self):
+        self.read_session.remove()
+        self.session.remove()
+
+    def after_fork(self):
+        # pooled connections belong to the parent; the child opens its own
+        for pooled_engine in {self.engine, self.read_engine}:
+            pooled_engine.dispose(close=False)
+
+open_databases = weakref.WeakSet()
+
+def current_db():
+    return current_app.extensions["db"]
+
 Base = declarative_base()
 
-app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(minutes=180)
-app.config["JWT_REFRESH_TOKEN_EXPIRES"] = timedelta(days=7)
-app.config["JWT_TOKEN_LOCATION"] = ["headers"]
-app.config["JWT_COOKIE_SECURE"] = False
-app.config["JWT_COOKIE_CSRF_PROTECT"] = False
-app.config['JWT_SECRET_KEY'] = 'your-very-secret-key'
+jwt = JWTManager()
+bcrypt = Bcrypt()
+
+
+class HashPoolSaturated(Exception):
+    pass
+
+
+class HashingPool:
+    # bcrypt runs on a fixed set of threads; once every worker is busy and the
+    # queue is full, new requests are rejected instead of piling up. Bulk imports
+    # never take those slots: they wait on a separate, smaller semaphore, so at most
+    # half the workers hash imported passwords and login/registration always get the rest
+    def __init__(self, workers=DEFAULT_CONFIG["HASH_POOL_WORKERS"], max_queue=DEFAULT_CONFIG["HASH_POOL_MAX_QUEUE"]):
+        self._lock = threading.Lock()
+        self.configure(workers, max_queue)
+
+    def init_app(self, app):
+        self.configure(app.config["HASH_POOL_WORKERS"], app.config["HASH_POOL_MAX_QUEUE"])
+
+    def configure(self, workers, max_queue):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = None
+        self.bulk_workers = max(1, workers // 2)
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._bulk_slots = threading.BoundedSemaphore(self.bulk_workers)
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def executor(self):
+        # threads are started on first use, so a preloading parent never forks with live workers
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+        self.configure(self.workers, self.max_queue)
+
+    def _finish(self):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def _release(self, future):
+        self._finish()
+        self._slots.release()
+
+    def _release_bulk(self, future):
+        self._finish()
+        self._bulk_slots.release()
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashPoolSaturated()
+        with self._lock:
+            self.in_flight += 1
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        return future.result()
+
+    def generate_password_hash(self, password):
+        return self.run(bcrypt.generate_password_hash, password).decode('utf-8')
+
+    def generate_password_hashes(self, passwords):
+        # bulk imports wait for one of their own slots instead of being shed
+        futures = []
+        for password in passwords:
+            self._bulk_slots.acquire()
+            with self._lock:
+                self.in_flight += 1
+            future = self.executor.submit(bcrypt.generate_password_hash, password)
+            future.add_done_callback(self._release_bulk)
+            futures.append(future)
+        return [future.result().decode('utf-8') for future in futures]
+
+    def check_password_hash(self, pw_hash, password):
+        return self.run(bcrypt.check_password_hash, pw_hash, password)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "bulk_workers": self.bulk_workers,
+                "in_flight": self.in_flight,
+                "queued": max(self.in_flight - self.workers, 0),
+                "completed": self.completed,
+                "rejected": self.rejected
+            }
 
 
-jwt = JWTManager(app)
-bcrypt = Bcrypt(app)
+class IdentityCache:
+    # Tokens carry the caller's role and custId plus the identity_version they were issued
+    # under. A trigger bumps that counter whenever a customer's role, username or active flag
+    # changes, so while it still matches the claims are current and no query is needed. Each
+    # process re-reads the counter at most every IDENTITY_VERSION_TTL seconds (and at once
+    # after its own customer writes), so a demotion or deactivation reaches every worker, and
+    # a restarted one, within that window. Tokens from an older version fall back to a
+    # username -> {"id", "role"} lookup (None for deactivated accounts), cached per version.
+    _MISSING = object()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.extensions["identity_cache"] = {"version": None, "checked_at": 0.0, "entries": {}}
+
+    @staticmethod
+    def stored_version(db):
+        return db.query(Counter.value).filter(Counter.name == "identity_version").scalar()
+
+    def version(self, db, refresh=False):
+        cache = current_app.extensions["identity_cache"]
+        now = time.monotonic()
+        if not refresh and cache["version"] is not None and now - cache["checked_at"] < current_app.config["IDENTITY_VERSION_TTL"]:
+            return cache["version"]
+        version = self.stored_version(db)
+        with self._lock:
+            if version is None or cache["version"] != version:
+                cache["version"], cache["entries"] = version, {}
+            cache["checked_at"] = now
+        return version
+
+    def expire(self):
+        current_app.extensions["identity_cache"]["checked_at"] = 0.0
+
+    @staticmethod
+    def claims(customer, version):
+        return {"role": customer.role, "custId": customer.id, "identity_version": version}
+
+    def resolve(self, db, username, claims):
+        version = self.version(db)
+        issued = claims.get("identity_version")
+        if issued is not None and (version is None or issued > version):
+            # the token was issued after a change this process has not seen yet
+            version = self.version(db, refresh=True)
+        if version is not None and issued == version:
+            return {"id": claims["custId"], "role": claims["role"]}
+        cache = current_app.extensions["identity_cache"]
+        with self._lock:
+            entry = cache["entries"].get(username, self._MISSING)
+        if entry is not self._MISSING:
+            return entry
+        customer = db.query(Customer.id, Customer.role).filter(Customer.username == username, Customer.active == True).first()
+        entry = {"id": customer.id, "role": customer.role} if customer else None
+        with self._lock:
+            if cache["version"] == version and version is not None:
+                cache["entries"][username] = entry
+        return entry
+
+
+identity_cache = IdentityCache()
+
+def current_identity(db):
+    return identity_cache.resolve(db, get_jwt_identity(), get_jwt())
+
+def manager_required(view):
+    @wraps(view)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        identity = current_identity(get_db_session(readonly=True))
+        if not identity or identity["role"] != 'manager':
+            logger.warning("Access denied to %s for username: %s", request.path, get_jwt_identity())
+            return jsonify({"error": "Access denied"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+hash_pool = HashingPool()
+
+@bp.app_errorhandler(HashPoolSaturated)
+def hash_pool_saturated(e):
+    logger.warning("Hashing pool saturated, shedding request")
+    response = jsonify({"error": "Server is busy, please retry shortly."})
+    response.headers["Retry-After"] = str(current_app.config["HASH_POOL_RETRY_AFTER"])
+    return response, 503
 
 class Customer(Base):
     __tablename__ = "customers"
@@ -63,9 +439,10 @@ class Customer(Base):
     username = Column(String(100), unique=True, nullable=False)
     password = Column(String(128), nullable=False)
     active = Column(Boolean, default=True)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
 
     def __repr__(self):
-        return f"<Customer(id={self.id}, firstName={self.firstName}, lastName={self.lastName}, city={self.city}, age={self.age}, birthDate={self.birthDate}, active={self.active}, phoneNumber={self.phoneNumber}, email={self.email}, role={self.role}, username={self.username}, password={self.password})>"
+        return f"<Customer(id={self.id}, firstName={self.firstName}, lastName={self.lastName}, city={self.city}, age={self.age}, birthDate={self.birthDate}, active={self.active}, phoneNumber={self.phoneNumber}, email={self.email}, role={self.role}, username={self.username})>"
 
 class Loan(Base):
     __tablename__ = "loans"
@@ -78,10 +455,26 @@ class Loan(Base):
     lateDays_num = Column(Integer, nullable=True)
     isLate = Column(Boolean, default=False)
     active = Column(Boolean, default=True)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
 
     def __repr__(self):
         return f"<Loan(id={self.id}, custId={self.custId}, bookId={self.bookId}, loanDate={self.loanDate}, expected_returnDate={self.expected_returnDate}, returnDate={self.returnDate}, lateDays_num={self.lateDays_num}, isLate={self.isLate}, active={self.active})>"
 
+class LoanHistory(Base):
+    # returned loans moved out of `loans` by the archival job, under their original ids
+    __tablename__ = "loan_history"
+    custId = Column(Integer, ForeignKey("customers.id"), nullable=False)
+    bookId = Column(Integer, ForeignKey("books.id"), nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    loanDate = Column(Date(), nullable=False)
+    expected_returnDate = Column(Date(), nullable=False)
+    returnDate = Column(Date(), nullable=True)
+    lateDays_num = Column(Integer, nullable=True)
+    isLate = Column(Boolean, default=False)
+
+    def __repr__(self):
+        return f"<LoanHistory(id={self.id}, custId={self.custId}, bookId={self.bookId}, loanDate={self.loanDate}, expected_returnDate={self.expected_returnDate}, returnDate={self.returnDate}, lateDays_num={self.lateDays_num}, isLate={self.isLate})>"
+
 class Book(Base):
     __tablename__ = "books"
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -91,6 +484,7 @@ class Book(Base):
     bookLoanType = Column(Integer, nullable=False)
     isLoaned = Column(Boolean, default=True)
     active = Column(Boolean, default=True)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
 
     def __repr__(self):
         return f"<Book(id={self.id}, name={self.name}, author={self.author}, publishYear={self.publishYear}, bookLoanType={self.bookLoanType}, isLoaned={self.isLoaned}, active={self.active})>"
@@ -103,63 +497,1121 @@ class Type(Base):
     def __repr__(self):
         return f"<Type(loanType={self.loanType}, num_of_days={self.num_of_days})>"
 
-Base.metadata.create_all(bind=engine)
-
-def get_db_session():
-    return SessionLocal()
+class Counter(Base):
+    __tablename__ = "counters"
+    name = Column(String(50), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+    updatedAt = Column(DateTime, nullable=True)
 
-@app.route("/")
+    def __repr__(self):
+        return f"<Counter(name={self.name}, value={self.value}, updatedAt={self.updatedAt})>"
+
+# Secondary indexes for the access patterns of the endpoints. Most rows are
+# soft-deleted history, so the hot paths use partial indexes over active rows.
+# The id-ordered pages of books and customers are the exception: on tables that are mostly
+# active, ANALYZE leads SQLite to skip a partial (id) WHERE active index and walk the rowid,
+# which reads every soft-deleted row it meets. A plain (active, id) index is searched instead.
+Index("ix_books_active_pages", Book.active, Book.id)
+Index("ix_customers_active_pages", Customer.active, Customer.id)
+Index("ix_books_active_publishYear", Book.publishYear, sqlite_where=Book.active == True)
+Index("ix_loans_custId_id", Loan.custId, Loan.id)
+Index("ix_loans_bookId", Loan.bookId)
+Index("ix_loans_active_id", Loan.id, sqlite_where=Loan.active == True)
+Index("ix_loans_active_expected_returnDate", Loan.expected_returnDate, sqlite_where=Loan.active == True)
+Index("ix_loans_late_id", Loan.id, sqlite_where=and_(Loan.active == True, Loan.isLate == True))
+# at most one outstanding loan per book
+Index("ux_loans_active_bookId", Loan.bookId, unique=True, sqlite_where=Loan.active == True)
+Index("ix_books_version", Book.version)
+Index("ix_customers_version", Customer.version)
+Index("ix_loans_version", Loan.version)
+# closed loans waiting for the archival job, and the per-customer history it builds up
+Index("ix_loans_closed_returnDate", Loan.returnDate, sqlite_where=Loan.active == False)
+Index("ix_loan_history_custId_id", LoanHistory.custId, LoanHistory.id)
+
+def migrate_columns(engine):
+    # create_all never alters existing tables, so columns added to a model later are appended here
+    with engine.begin() as conn:
+        for table_obj in Base.metadata.sorted_tables:
+            existing = {row[1] for row in conn.execute(text(f'PRAGMA table_info("{table_obj.name}")'))}
+            for col in table_obj.columns:
+                if col.name not in existing:
+                    conn.execute(text(f'ALTER TABLE "{table_obj.name}" ADD COLUMN {CreateColumn(col).compile(dialect=engine.dialect)}'))
+                    logger.info("Added column %s.%s", table_obj.name, col.name)
+
+# indexes earlier versions created that nothing uses any more (the planner never chose the
+# partial id indexes; ix_books_active_pages and ix_customers_active_pages replace them)
+RETIRED_INDEXES = ("ix_books_active_id", "ix_customers_active_id")
+
+def migrate_indexes(engine):
+    # create_all skips tables that already exist, so indexes added later are created one by one
+    with engine.begin() as conn:
+        for name in RETIRED_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    for table_obj in Base.metadata.sorted_tables:
+        for index in table_obj.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except IntegrityError:
+                # existing rows violate a unique index; leave it missing so check_schema reports it
+                logger.error("Cannot create unique index %s: existing rows violate it", index.name)
+
+def missing_indexes(engine):
+    with engine.connect() as conn:
+        existing = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+    return sorted(index.name for table_obj in Base.metadata.sorted_tables for index in table_obj.indexes
+                  if index.name not in existing)
+
+# Full-text search: FTS5 shadow tables over the active rows of books and
+# customers, kept in sync by triggers so every write path is covered.
+SEARCH_INDEXES = {
+    "books_fts": ("books", ["name", "author"]),
+    "customers_fts": ("customers", ["firstName", "lastName", "email", "phoneNumber", "city", "username"]),
+}
+
+books_fts = table("books_fts", column("rowid"), column("rank"))
+customers_fts = table("customers_fts", column("rowid"), column("rank"))
+
+def setup_search_index(engine):
+    try:
+        with engine.begin() as conn:
+            # bulk loads register here to skip the per-row trigger and index their rows in one statement
+            conn.execute(text("CREATE TABLE IF NOT EXISTS search_index_deferred (name VARCHAR(50) PRIMARY KEY)"))
+            for fts_name, (source, columns) in SEARCH_INDEXES.items():
+                exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": fts_name}).first()
+                cols = ", ".join(f'"{c}"' for c in columns)
+                new_cols = ", ".join(f'new."{c}"' for c in columns)
+                conn.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_name} USING fts5({cols}, prefix='2 3')"))
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {fts_name}_ai"))
+                conn.execute(text(f"""
+                    CREATE TRIGGER {fts_name}_ai AFTER INSERT ON {source}
+                    WHEN new.active AND NOT EXISTS (SELECT 1 FROM search_index_deferred WHERE name = '{fts_name}') BEGIN
+                        INSERT INTO {fts_name}(rowid, {cols}) VALUES (new.id, {new_cols});
+                    END"""))
+                # only updates touching indexed columns rewrite the entry, not checkouts or version bumps
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {fts_name}_au"))
+                conn.execute(text(f"""
+                    CREATE TRIGGER {fts_name}_au AFTER UPDATE OF active, {cols} ON {source} BEGIN
+                        DELETE FROM {fts_name} WHERE rowid = old.id;
+                        INSERT INTO {fts_name}(rowid, {cols}) SELECT new.id, {new_cols} WHERE new.active;
+                    END"""))
+                conn.execute(text(f"""
+                    CREATE TRIGGER IF NOT EXISTS {fts_name}_ad AFTER DELETE ON {source} BEGIN
+                        DELETE FROM {fts_name} WHERE rowid = old.id;
+                    END"""))
+                if not exists:
+                    conn.execute(text(f"INSERT INTO {fts_name}(rowid, {cols}) SELECT id, {cols} FROM {source} WHERE active"))
+                    logger.info("Built search index %s", fts_name)
+        return True
+    except OperationalError as e:
+        logger.warning("Full-text search unavailable, falling back to substring search: %s", e)
+        return False
+
+def search_index_available(engine):
+    with engine.connect() as conn:
+        found = conn.execute(text("SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name IN :names").bindparams(
+            bindparam("names", expanding=True)), {"names": list(SEARCH_INDEXES)}).scalar()
+    return found == len(SEARCH_INDEXES)
+
+# Row counters for the dashboard, maintained by triggers like the search index so
+# bulk imports and every endpoint keep them current without a COUNT(*) per request.
+ROW_COUNTERS = {
+    "books_active": ("books", '{row}.active'),
+    "books_loaned": ("books", '{row}.active AND {row}."isLoaned"'),
+    "customers_active": ("customers", '{row}.active'),
+}
+
+def setup_row_counters(engine, recount=False):
+    touched = "\"updatedAt\" = strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')"
+    with engine.begin() as conn:
+        for name, (source, condition) in ROW_COUNTERS.items():
+            new, old = (f"coalesce({condition.format(row=row)}, 0)" for row in ("new", "old"))
+            exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": f"{name}_ai"}).first()
+            conn.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS {name}_ai AFTER INSERT ON {source} WHEN {new} BEGIN
+                    UPDATE counters SET value = value + 1, {touched} WHERE name = '{name}';
+                END"""))
+            conn.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS {name}_au AFTER UPDATE ON {source} WHEN {new} != {old} BEGIN
+                    UPDATE counters SET value = value + {new} - {old}, {touched} WHERE name = '{name}';
+                END"""))
+            conn.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS {name}_ad AFTER DELETE ON {source} WHEN {old} BEGIN
+                    UPDATE counters SET value = value - 1, {touched} WHERE name = '{name}';
+                END"""))
+            if recount or not exists:
+                conn.execute(text(f"""
+                    INSERT OR REPLACE INTO counters (name, value, "updatedAt")
+                    SELECT '{name}', count(*), strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')
+                    FROM {source} WHERE {condition.format(row=source)}"""))
+
+
+# Delta sync: every insert or update of a synced row stamps it with the next value of the
+# global sync_version counter, so clients can ask for the rows changed since a version.
+# Bulk loads skip the insert trigger through the search index's deferred marker table.
+SYNC_MODELS = {"books": Book, "customers": Customer, "loans": Loan}
+
+def setup_sync_versions(engine):
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS search_index_deferred (name VARCHAR(50) PRIMARY KEY)"))
+        conn.execute(text("INSERT OR IGNORE INTO counters (name, value) VALUES ('sync_version', 0)"))
+        for source, model in SYNC_MODELS.items():
+            columns = [c.name for c in model.__table__.columns if c.name not in ("id", "version")]
+            tracked = ", ".join(f'"{c}"' for c in columns)
+            changed = " OR ".join(f'new."{c}" IS NOT old."{c}"' for c in columns)
+            stamp = f"""
+                UPDATE counters SET value = value + 1 WHERE name = 'sync_version';
+                UPDATE {source} SET version = (SELECT value FROM counters WHERE name = 'sync_version') WHERE id = new.id;"""
+            conn.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS {source}_version_ai AFTER INSERT ON {source}
+                WHEN NOT EXISTS (SELECT 1 FROM search_index_deferred WHERE name = '{source}_version') BEGIN {stamp} END"""))
+            # listing the columns keeps the trigger's own version write from firing it again, and
+            # the WHEN skips updates that rewrite the same values (the overdue sweep, a no-op PUT)
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {source}_version_au"))
+            conn.execute(text(f"CREATE TRIGGER {source}_version_au AFTER UPDATE OF {tracked} ON {source} WHEN {changed} BEGIN {stamp} END"))
+
+# Response cache generations: tag -> (table, model) whose writes invalidate it. Triggers bump
+# the tag's <tag>_version counter, so a write through any worker or script invalidates the
+# cached views of every process.
+CACHE_TAG_SOURCES = {"catalog": ("books", Book)}
+
+def setup_cache_versions(engine):
+    with engine.begin() as conn:
+        for tag, (source, model) in CACHE_TAG_SOURCES.items():
+            name = f"{tag}_version"
+            # the sync version stamp rewrites "version" after every write; leave it out so one write bumps once
+            columns = [c.name for c in model.__table__.columns if c.name not in ("id", "version")]
+            tracked = ", ".join(f'"{c}"' for c in columns)
+            changed = " OR ".join(f'new."{c}" IS NOT old."{c}"' for c in columns)
+            bump = f"UPDATE counters SET value = value + 1 WHERE name = '{name}';"
+            conn.execute(text("INSERT OR IGNORE INTO counters (name, value) VALUES (:name, 0)"), {"name": name})
+            conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {name}_ai AFTER INSERT ON {source} BEGIN {bump} END"))
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}_au"))
+            conn.execute(text(f"CREATE TRIGGER {name}_au AFTER UPDATE OF {tracked} ON {source} WHEN {changed} BEGIN {bump} END"))
+            conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {name}_ad AFTER DELETE ON {source} BEGIN {bump} END"))
+
+# Revocation stamp for IdentityCache: any change to what a token's identity resolves to
+# bumps identity_version, whichever worker or script made it.
+IDENTITY_COLUMNS = '"role", "username", "active"'
+
+def setup_identity_version(engine):
+    bump = "UPDATE counters SET value = value + 1 WHERE name = 'identity_version';"
+    changed = " OR ".join(f"new.{c} IS NOT old.{c}" for c in IDENTITY_COLUMNS.split(", "))
+    with engine.begin() as conn:
+        conn.execute(text("INSERT OR IGNORE INTO counters (name, value) VALUES ('identity_version', 0)"))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS customers_identity_au AFTER UPDATE OF {IDENTITY_COLUMNS} ON customers
+            WHEN {changed} BEGIN {bump} END"""))
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS customers_identity_ad AFTER DELETE ON customers BEGIN {bump} END"))
+
+def check_schema(engine):
+    missing = missing_indexes(engine)
+    if missing:
+        logger.error("Missing database indexes, run `flask migrate-db`: %s", ', '.join(missing))
+    return not missing
+
+def migrate_schema(engine, recount=False):
+    # everything the app used to do on import: tables, late columns and indexes, search index, triggers
+    Base.metadata.create_all(bind=engine)
+    migrate_columns(engine)
+    migrate_indexes(engine)
+    setup_search_index(engine)
+    setup_row_counters(engine, recount=recount)
+    setup_sync_versions(engine)
+    setup_identity_version(engine)
+    setup_cache_versions(engine)
+    # imported here rather than at the top: reports builds on this module
+    from reports import setup_report_aggregates
+    setup_report_aggregates(engine)
+
+@bp.cli.command("migrate-db")
+def migrate_db_command():
+    engine = current_db().engine
+    migrate_schema(engine, recount=True)
+    print("Schema is up to date" if check_schema(engine) else "Schema migration incomplete, see app.log")
+
+def set_counter(db, name, value):
+    counter = db.get(Counter, name)
+    if counter is None:
+        counter = Counter(name=name)
+        db.add(counter)
+    counter.value = value
+    counter.updatedAt = datetime.now()
+
+def bump_counter(db, name, delta):
+    counter = db.get(Counter, name)
+    if counter is not None:
+        counter.value = max(counter.value + delta, 0)
+        counter.updatedAt = datetime.now()
+
+def late_days_expression(today):
+    return cast(func.julianday(today.isoformat()) - func.julianday(Loan.expected_returnDate), Integer)
+
+def sweep_overdue_loans(today=None):
+    # flag every outstanding loan past its return date in one UPDATE and refresh the overdue counter;
+    # loans already flagged with today's count are left alone, so a rerun writes (and stamps) nothing
+    today = today or datetime.today().date()
+    db = get_db_session()
+    try:
+        late_days = late_days_expression(today)
+        flagged = db.query(Loan).filter(Loan.active == True, Loan.expected_returnDate < today,
+                                        or_(Loan.isLate.is_not(True), Loan.lateDays_num.is_distinct_from(late_days))).update(
+            {Loan.isLate: True, Loan.lateDays_num: late_days}, synchronize_session=False)
+        overdue = db.query(func.count(Loan.id)).filter(Loan.active == True, Loan.isLate == True).scalar()
+        set_counter(db, "overdue_loans", overdue)
+        db.commit()
+        logger.info("Overdue sweep updated %s loans, %s currently overdue", flagged, overdue)
+        return flagged
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error("Overdue sweep failed: %s", e)
+        return 0
+    finally:
+        current_db().session.remove()
+
+HISTORY_COLUMNS = [column.name for column in LoanHistory.__table__.columns]
+
+class LoanArchiver:
+    # Moves returned loans closed before the archive horizon from loans to loan_history, one
+    # batch per transaction so the write lock is never held for long. The row with the highest
+    # id always stays behind: SQLite hands out max(id) + 1, and an emptied table would start
+    # reusing ids that are already in the history.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runs = 0
+        self._moved = 0
+        self._failures = 0
+        self._last_duration = 0.0
+
+    def run(self, today=None):
+        config = current_app.config
+        cutoff = (today or datetime.today().date()) - timedelta(days=config["LOAN_ARCHIVE_AFTER_DAYS"])
+        batch_size = config["LOAN_ARCHIVE_BATCH_SIZE"]
+        start = time.perf_counter()
+        moved = 0
+        db = get_db_session()
+        try:
+            while True:
+                newest = db.query(func.max(Loan.id)).scalar() or 0
+                closed = and_(Loan.active == False, Loan.returnDate < cutoff, Loan.id < newest)
+                last_id = db.query(Loan.id).filter(closed).order_by(Loan.id).offset(batch_size - 1).limit(1).scalar()
+                batch = and_(closed, Loan.id <= last_id) if last_id is not None else closed
+                copied = db.execute(insert(LoanHistory).from_select(
+                    HISTORY_COLUMNS, select(*(getattr(Loan, name) for name in HISTORY_COLUMNS)).where(batch))).rowcount
+                if not copied:
+                    db.rollback()
+                    break
+                # delta sync clients older than the newest archived change can no longer get its tombstone
+                archived_version = db.query(func.max(Loan.version)).filter(batch).scalar()
+                db.query(Loan).filter(batch).delete(synchronize_session=False)
+                counter = db.get(Counter, "loans_archived_version")
+                set_counter(db, "loans_archived_version", max(archived_version, counter.value if counter else 0))
+                db.commit()
+                moved += copied
+                if last_id is None:
+                    break
+            logger.info("Loan archival moved %s loans returned before %s", moved, cutoff)
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error("Loan archival failed after %s loans: %s", moved, e)
+            with self._lock:
+                self._failures += 1
+        finally:
+            current_db().session.remove()
+            with self._lock:
+                self._runs += 1
+                self._moved += moved
+                self._last_duration = time.perf_counter() - start
+        return moved
+
+    def stats(self):
+        with self._lock:
+            return {"runs": self._runs, "moved": self._moved, "failures": self._failures,
+                    "last_duration_seconds": round(self._last_duration, 3)}
+
+
+loan_archiver = LoanArchiver()
+
+def archived_loans_version(db):
+    return db.query(Counter.value).filter(Counter.name == "loans_archived_version").scalar() or 0
+
+class ScheduledJob(threading.Thread):
+    def __init__(self, app, interval, job, name):
+        super().__init__(name=name, daemon=True)
+        self.app = app
+        self.interval = interval
+        self.job = job
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            with self.app.app_context():
+                self.job()
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+
+def start_maintenance_jobs(app):
+    jobs = [ScheduledJob(app, app.config["OVERDUE_SWEEP_INTERVAL"], sweep_overdue_loans, "overdue-sweep"),
+            ScheduledJob(app, app.config["LOAN_ARCHIVE_INTERVAL"], loan_archiver.run, "loan-archival")]
+    for job in jobs:
+        job.start()
+    return jobs
+
+@bp.cli.command("sweep-overdue")
+def sweep_overdue_command():
+    flagged = sweep_overdue_loans()
+    print(f"Flagged {flagged} overdue loans")
+
+@bp.cli.command("archive-loans")
+@click.option("--after-days", type=int, help="archive loans returned more than this many days ago")
+def archive_loans_command(after_days):
+    if after_days is not None:
+        current_app.config["LOAN_ARCHIVE_AFTER_DAYS"] = after_days
+    moved = loan_archiver.run()
+    print(f"Archived {moved} loans")
+
+@contextmanager
+def deferred_search_index(db, fts_name):
+    # must run inside the inserting transaction: SQLite's single writer lock keeps the id range ours
+    if not current_db().search_enabled:
+        yield
+        return
+    source, columns = SEARCH_INDEXES[fts_name]
+    cols = ", ".join(f'"{c}"' for c in columns)
+    db.execute(text("INSERT INTO search_index_deferred (name) VALUES (:name)"), {"name": fts_name})
+    last_id = db.execute(text(f"SELECT coalesce(max(id), 0) FROM {source}")).scalar()
+    yield
+    db.execute(text(f"INSERT INTO {fts_name}(rowid, {cols}) SELECT id, {cols} FROM {source} WHERE id > :last_id AND active"),
+               {"last_id": last_id})
+    db.execute(text("DELETE FROM search_index_deferred WHERE name = :name"), {"name": fts_name})
+
+@contextmanager
+def deferred_sync_versions(db, source, rows):
+    # reserve one block of versions and stamp the rows before inserting them, instead of
+    # letting the trigger bump the counter and rewrite every row after its insert
+    marker = f"{source}_version"
+    db.execute(text("INSERT INTO search_index_deferred (name) VALUES (:name)"), {"name": marker})
+    base = db.execute(text("UPDATE counters SET value = value + :count WHERE name = 'sync_version' RETURNING value"),
+                      {"count": len(rows)}).scalar() - len(rows)
+    for offset, fields in enumerate(rows, start=1):
+        fields["version"] = base + offset
+    yield
+    db.execute(text("DELETE FROM search_index_deferred WHERE name = :name"), {"name": marker})
+
+def fts_match_expression(fields):
+    # each field becomes a column-scoped prefix phrase, e.g. name : "harry pot"*
+    terms = []
+    for name, value in fields.items():
+        tokens = re.findall(r"\w+", value)
+        if not tokens:
+            return None
+        terms.append(f'{name} : "{" ".join(tokens)}"*')
+    return " AND ".join(terms)
+
+def ranked_matches(query, fts, model, match, narrowed=False):
+    # joins the FTS matches ordered by relevance. bm25 is computed for every row it orders, so
+    # unless other filters narrow the result (and could empty a window) only the first
+    # SEARCH_RANK_CANDIDATES matches in rowid order are ranked: FTS5 applies the rowid bound itself
+    matches = literal_column(fts.name).op("MATCH")
+    query = query.join(fts, fts.c.rowid == model.id).filter(matches(match))
+    candidates = current_app.config["SEARCH_RANK_CANDIDATES"]
+    if candidates and not narrowed:
+        window = select(fts.c.rowid).where(matches(match)).limit(candidates).subquery()
+        query = query.filter(fts.c.rowid <= select(func.max(window.c.rowid)).scalar_subquery())
+    return query.order_by(fts.c.rank)
+
+def use_substring_search():
+    return not current_db().search_enabled or request.args.get("mode") == "substring"
+
+def get_db_session(readonly=False):
+    if readonly:
+        return current_db().read_session()
+    return current_db().session()
+
+def remove_db_sessions(exception=None):
+    current_db().remove_sessions()
+
+class RequestMetrics:
+    def __init__(self, buckets=DEFAULT_CONFIG["METRICS_LATENCY_BUCKETS"]):
+        self.buckets = buckets
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        with self._lock:
+            if tuple(app.config["METRICS_LATENCY_BUCKETS"]) != tuple(self.buckets):
+                self.buckets = app.config["METRICS_LATENCY_BUCKETS"]
+                self._routes = {}
+
+    def observe(self, route, method, duration, queries, db_time, serialize_time):
+        with self._lock:
+            stats = self._routes.get((route, method))
+            if stats is None:
+                stats = self._routes[(route, method)] = {
+                    "buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0,
+                    "queries": 0, "db_seconds": 0.0, "serialize_seconds": 0.0
+                }
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    stats["buckets"][i] += 1
+            stats["count"] += 1
+            stats["sum"] += duration
+            stats["queries"] += queries
+            stats["db_seconds"] += db_time
+            stats["serialize_seconds"] += serialize_time
+
+    def render(self):
+        lines = [
+            "# HELP http_request_duration_seconds Request latency by route.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        with self._lock:
+            routes = {key: dict(stats, buckets=list(stats["buckets"])) for key, stats in self._routes.items()}
+        for (route, method), stats in sorted(routes.items()):
+            labels = f'route="{route}",method="{method}"'
+            for bound, count in zip(self.buckets, stats["buckets"]):
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats["count"]}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {stats['sum']:.6f}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {stats['count']}")
+        for name, key, kind, help_text in (
+            ("http_request_sql_statements_total", "queries", "counter", "SQL statements executed by route."),
+            ("http_request_db_seconds_total", "db_seconds", "counter", "Time spent executing SQL by route."),
+            ("http_request_serialization_seconds_total", "serialize_seconds", "counter", "Time spent encoding JSON by route."),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (route, method), stats in sorted(routes.items()):
+                lines.append(f'{name}{{route="{route}",method="{method}"}} {round(stats[key], 6)}')
+        bus = event_bus.stats()
+        lines.append("# TYPE event_subscribers gauge")
+        lines.append(f"event_subscribers {bus['subscribers']}")
+        lines.append("# TYPE events_published_total counter")
+        lines.append(f"events_published_total {bus['published']}")
+        lines.append("# TYPE event_subscribers_dropped_total counter")
+        lines.append(f"event_subscribers_dropped_total {bus['dropped']}")
+        archival = loan_archiver.stats()
+        lines.append("# TYPE loan_archive_runs_total counter")
+        lines.append(f"loan_archive_runs_total {archival['runs']}")
+        lines.append("# TYPE loan_archive_rows_moved_total counter")
+        lines.append(f"loan_archive_rows_moved_total {archival['moved']}")
+        lines.append("# TYPE loan_archive_failures_total counter")
+        lines.append(f"loan_archive_failures_total {archival['failures']}")
+        lines.append("# TYPE loan_archive_last_duration_seconds gauge")
+        lines.append(f"loan_archive_last_duration_seconds {archival['last_duration_seconds']}")
+        pool = hash_pool.stats()
+        lines.append("# TYPE hashing_pool_in_flight gauge")
+        lines.append(f"hashing_pool_in_flight {pool['in_flight']}")
+        lines.append("# TYPE hashing_pool_rejected_total counter")
+        lines.append(f"hashing_pool_rejected_total {pool['rejected']}")
+        return "\n".join(lines) + "\n"
+
+
+request_metrics = RequestMetrics()
+
+def json_default(o):
+    # dates go out as ISO strings ("2024-05-01"), the same as orjson encodes them natively
+    if isinstance(o, date):
+        return o.isoformat()
+    return DefaultJSONProvider.default(o)
+
+class TimedJSONProvider(DefaultJSONProvider):
+    # the standard library encoder; responses are encoded straight to bytes and every
+    # encode is timed for the serialization metric. Keys keep the order the fields are declared in.
+    sort_keys = False
+    default = staticmethod(json_default)
+
+    def encode(self, obj):
+        return json.dumps(obj, default=self.default, ensure_ascii=self.ensure_ascii, sort_keys=self.sort_keys,
+                          separators=(",", ":")).encode()
+
+    def dumpb(self, obj):
+        start = time.perf_counter()
+        try:
+            return self.encode(obj)
+        finally:
+            if has_request_context():
+                g.serialize_time = g.get("serialize_time", 0.0) + time.perf_counter() - start
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumpb(obj).decode()
+
+    def response(self, *args, **kwargs):
+        return self._app.response_class(self.dumpb(self._prepare_response_obj(args, kwargs)), mimetype=self.mimetype)
+
+class OrjsonProvider(TimedJSONProvider):
+    # orjson encodes dicts, lists, tuples and dates in C and returns bytes, so nothing is
+    # decoded and re-encoded on the way to the response body
+    def encode(self, obj):
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if self.sort_keys else 0)
+        return orjson.dumps(obj, default=self.default, option=option)
+
+JSON_PROVIDERS = {"json": TimedJSONProvider, "orjson": OrjsonProvider}
+
+def json_provider_class(name):
+    if name == "orjson" and orjson is None:
+        logger.warning("orjson is not installed, falling back to the standard library JSON encoder")
+        return TimedJSONProvider
+    return JSON_PROVIDERS[name]
+
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    if has_request_context():
+        g.sql_count = g.get("sql_count", 0) + 1
+        g.db_time = g.get("db_time", 0.0) + elapsed
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if current_app.config["PROFILE_SLOW_REQUEST_MS"] is not None:
+        g.profiler = cProfile.Profile()
+        try:
+            g.profiler.enable()
+        except ValueError:
+            g.profiler = None
+
+@bp.after_app_request
+def record_request_metrics(response):
+    # streamed bodies are still being written at this point, so their latency is time to first byte
+    duration = time.perf_counter() - g.get("request_start", time.perf_counter())
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    request_metrics.observe(route, request.method, duration, g.get("sql_count", 0), g.get("db_time", 0.0),
+                            g.get("serialize_time", 0.0))
+    profiler = g.get("profiler")
+    if profiler is not None:
+        profiler.disable()
+        if duration * 1000 >= current_app.config["PROFILE_SLOW_REQUEST_MS"]:
+            os.makedirs(current_app.config["PROFILE_DIR"], exist_ok=True)
+            name = f"{datetime.now():%Y%m%d-%H%M%S-%f}_{request.method}{route.replace('/', '_')}.prof"
+            profiler.dump_stats(os.path.join(current_app.config["PROFILE_DIR"], name))
+            logger.warning("Slow request %s %s took %.1fms, profile saved to %s", request.method, request.path, duration * 1000, name)
+    return response
+
+# Content-Encoding -> compress(data, level), in order of preference when the client accepts several
+COMPRESSORS = {"gzip": lambda data, level: gzip.compress(data, compresslevel=level)}
+if brotli is not None:
+    COMPRESSORS = {"br": lambda data, level: brotli.compress(data, quality=level), **COMPRESSORS}
+
+@bp.after_app_request
+def compress_response(response):
+    config = current_app.config
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or "Content-Encoding" in response.headers or response.mimetype not in config["COMPRESS_MIMETYPES"]):
+        return response
+    body = response.get_data()
+    if len(body) < config["COMPRESS_MIN_SIZE"]:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(COMPRESSORS)
+    if encoding is None:
+        return response
+    # cached catalog responses carry a content hash as their ETag, so the encoded body is kept
+    # next to it and a cache hit does not pay for compression again
+    etag, _ = response.get_etag()
+    key = (etag, encoding, config["COMPRESS_LEVEL"])
+    compressed = compressed_bodies.get(key) if etag else None
+    if compressed is None:
+        compressed = COMPRESSORS[encoding](body, config["COMPRESS_LEVEL"])
+        if etag:
+            compressed_bodies.set(key, compressed)
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    if etag:
+        # the encoded bytes differ from the identity body, so the validator is weak from here on
+        response.set_etag(etag, weak=True)
+    return response
+
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
+def paginate(query, id_column):
+    # keyset pagination on the primary key: ?limit=N&after=<last id seen>. Without a limit a
+    # page holds DEFAULT_PAGE_LIMIT rows; the whole list is only ever sent by ?stream=1.
+    limit = request.args.get("limit", type=int)
+    after = request.args.get("after", type=int)
+    if after is not None:
+        query = query.filter(id_column > after)
+    return first_page(query.order_by(id_column), limit)
+
+def page_limit(limit=None):
+    return min(max(limit or DEFAULT_PAGE_LIMIT, 1), MAX_PAGE_LIMIT)
+
+def first_page(query, limit=None, cursor="id"):
+    # fetch one extra row to learn whether there is a next page without a COUNT
+    limit = page_limit(limit)
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, getattr(rows[-1], cursor)
+    return rows, None
+
+STREAM_BATCH_SIZE = 1000
+
+def wants_stream():
+    return request.args.get("stream") == "1" or request.accept_mimetypes.best == "application/x-ndjson"
+
+def stream_response(query, id_column, serialize, fmt="ndjson"):
+    # one JSON object (or CSV record) per line, fetched from the cursor in batches so memory stays flat
+    after = request.args.get("after", type=int)
+    if after is not None:
+        query = query.filter(id_column > after)
+    query = query.order_by(id_column).yield_per(STREAM_BATCH_SIZE)
+
+    def generate():
+        dumps = current_app.json.dumps
+        for row in query:
+            yield dumps(serialize(row)) + "\n"
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = None
+        for row in query:
+            data = serialize(row)
+            if writer is None:
+                writer = csv.DictWriter(buffer, fieldnames=list(data))
+                writer.writeheader()
+            writer.writerow(data)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if fmt == "csv":
+        return Response(stream_with_context(generate_csv()), mimetype="text/csv")
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+def serialize_book(book):
+    return {
+        "id": book.id,
+        "name": book.name,
+        "author": book.author,
+        "publishYear": book.publishYear,
+        "bookLoanType": book.bookLoanType,
+        "isLoaned": book.isLoaned
+    }
+
+def calculate_age(birthDate, today=None):
+    today = today or datetime.today().date()
+    return today.year - birthDate.year - ((today.month, today.day) < (birthDate.month, birthDate.day))
+
+def serialize_customer(customer):
+    # age is derived from birthDate on the way out so reads never have to write it back
+    return {
+        "id": customer.id,
+        "firstName": customer.firstName,
+        "lastName": customer.lastName,
+        "age": calculate_age(customer.birthDate),
+        "city": customer.city,
+        "email": customer.email,
+        "phoneNumber": customer.phoneNumber
+    }
+
+def serialize_loan(loan):
+    return {
+        "id": loan.id,
+        "custId": loan.custId,
+        "bookId": loan.bookId,
+        "loanDate": loan.loanDate,
+        "expected_returnDate": loan.expected_returnDate,
+    }
+
+def serialize_late_loan(loan):
+    data = serialize_loan(loan)
+    data["lateDays_num"] = loan.lateDays_num
+    return data
+
+class LRUCacheBackend:
+    # in-process backend; anything with get/set can be swapped in via response_cache.init_app(app, backend)
+    def __init__(self, max_entries=256, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+CACHED_HEADERS = ("X-Next-Cursor", "X-Sync-Version")
+
+class ResponseCache:
+    # entries are keyed by tag generation, so invalidating a tag just bumps its
+    # generation and the stale entries age out of the backend on their own.
+    # The generation is the tag's <tag>_version counter (see setup_cache_versions),
+    # which triggers bump on every write, plus a local one for invalidate().
+    # entries live per app, so apps on different databases never share responses
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def init_app(self, app, backend=None):
+        backend = backend or LRUCacheBackend(app.config["RESPONSE_CACHE_MAX_ENTRIES"], app.config["RESPONSE_CACHE_TTL"])
+        app.extensions["response_cache"] = {"backend": backend, "generations": {}, "async_reads": {}}
+
+    @property
+    def backend(self):
+        return current_app.extensions["response_cache"]["backend"]
+
+    @property
+    def _generations(self):
+        return current_app.extensions["response_cache"]["generations"]
+
+    def invalidate(self, tag):
+        with self._lock:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+        logger.info("Invalidated response cache tag: %s", tag)
+
+    @staticmethod
+    def generation_query(tag):
+        return select(Counter.value).where(Counter.name == f"{tag}_version")
+
+    def stored_generation(self, tag):
+        # one primary-key lookup on a pooled connection, outside the view's session
+        with current_db().read_engine.connect() as conn:
+            return conn.execute(self.generation_query(tag)).scalar()
+
+    async def async_stored_generation(self, tag):
+        # The coroutine views await the lookup on the aiosqlite engine (app.extensions["async_db"],
+        # see asgi.py), so the event loop thread never runs a blocking query. Concurrent requests
+        # share one read per tag: a request joins the next read that has not started yet, so the
+        # value it gets was still read after it arrived, and cache hits do not queue for a
+        # connection each.
+        reads = current_app.extensions["response_cache"]["async_reads"].setdefault(tag, {"next": None, "running": None})
+        if reads["next"] is None:
+            reads["next"] = asyncio.ensure_future(self._read_generation(current_app._get_current_object(), tag, reads))
+        return await asyncio.shield(reads["next"])
+
+    async def _read_generation(self, app, tag, reads):
+        previous = reads["running"]
+        if previous is not None and not previous.done():
+            await asyncio.wait({previous})
+        reads["next"], reads["running"] = None, asyncio.current_task()
+        with app.app_context():
+            async with app.extensions["async_db"]() as db:
+                return await db.scalar(self.generation_query(tag))
+
+    def key_for(self, tag, stored):
+        args = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+        return f"{tag}:{stored}.{self._generations.get(tag, 0)}:{request.path}?{args}"
+
+    def _store(self, key, rv):
+        response = current_app.make_response(rv)
+        if response.status_code != 200:
+            return None
+        etag = hashlib.sha1(response.get_data()).hexdigest()
+        headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+        entry = (etag, response.get_data(), response.mimetype, headers)
+        self.backend.set(key, entry)
+        return entry
+
+    def _respond(self, entry):
+        etag, body, mimetype, headers = entry
+        response = Response(body, mimetype=mimetype, headers=headers)
+        response.set_etag(etag)
+        return response.make_conditional(request)
+
+    def cached(self, tag):
+        # wraps plain and async views alike; the async ones are the read views served by asgi.py
+        def decorator(view):
+            if inspect.iscoroutinefunction(view):
+                @wraps(view)
+                async def async_wrapper(*args, **kwargs):
+                    if request.method != 'GET' or wants_stream():
+                        return await view(*args, **kwargs)
+                    key = self.key_for(tag, await self.async_stored_generation(tag))
+                    entry = self.backend.get(key)
+                    if entry is None:
+                        rv = await view(*args, **kwargs)
+                        entry = self._store(key, rv)
+                        if entry is None:
+                            return rv
+                    return self._respond(entry)
+                return async_wrapper
+
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET' or wants_stream():
+                    return view(*args, **kwargs)
+                key = self.key_for(tag, self.stored_generation(tag))
+                entry = self.backend.get(key)
+                if entry is None:
+                    rv = view(*args, **kwargs)
+                    entry = self._store(key, rv)
+                    if entry is None:
+                        return rv
+                return self._respond(entry)
+            return wrapper
+        return decorator
+
+
+response_cache = ResponseCache()
+compressed_bodies = LRUCacheBackend(max_entries=64)
+
+class EventBusFull(Exception):
+    pass
+
+class Subscription:
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+class EventBus:
+    # in-process pub/sub for the /events stream. publish never blocks a request: a subscriber
+    # whose queue is full is cut off and told to resync instead of slowing the writers down
+    def __init__(self, queue_size=DEFAULT_CONFIG["EVENT_QUEUE_SIZE"], replay_size=DEFAULT_CONFIG["EVENT_REPLAY_SIZE"],
+                 max_subscribers=DEFAULT_CONFIG["EVENT_MAX_SUBSCRIBERS"]):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._recent = deque(maxlen=replay_size)
+        self._next_id = 1
+        self._published = 0
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        with self._lock:
+            self.queue_size = app.config["EVENT_QUEUE_SIZE"]
+            self.max_subscribers = app.config["EVENT_MAX_SUBSCRIBERS"]
+            self._recent = deque(self._recent, maxlen=app.config["EVENT_REPLAY_SIZE"])
+
+    def subscribe(self, last_event_id=None):
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise EventBusFull()
+            if last_event_id is not None:
+                # replay what the client missed while reconnecting, or ask it to resync when those
+                # events are no longer kept (or the id comes from before a restart)
+                oldest = self._recent[0][0] if self._recent else self._next_id
+                missed = [event for event in self._recent if event[0] > last_event_id]
+                if last_event_id + 1 < oldest or last_event_id >= self._next_id or len(missed) > self.queue_size:
+                    subscription.overflowed = True
+                else:
+                    for event in missed:
+                        subscription.queue.put_nowait(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event_type, data):
+        with self._lock:
+            event = (self._next_id, event_type, data)
+            self._next_id += 1
+            self._published += 1
+            self._recent.append(event)
+            for subscription in list(self._subscribers):
+                try:
+                    subscription.queue.put_nowait(event)
+                except queue.Full:
+                    subscription.overflowed = True
+                    self._subscribers.discard(subscription)
+                    self._dropped += 1
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": len(self._subscribers), "published": self._published, "dropped": self._dropped}
+
+
+event_bus = EventBus()
+
+def format_event(event_id, event_type, data):
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, default=json_default)}\n\n"
+
+def publish_loan_change(event_type, loan):
+    # called after commit: the loan event plus the availability change of its book
+    event_bus.publish(event_type, loan)
+    event_bus.publish("book.availability", {"id": loan["bookId"], "isLoaned": event_type == "loan.checkout"})
+
+BOOK_COLUMNS = (Book.id, Book.name, Book.author, Book.publishYear, Book.bookLoanType, Book.isLoaned)
+CUSTOMER_COLUMNS = (Customer.id, Customer.firstName, Customer.lastName, Customer.birthDate, Customer.city,
+                    Customer.email, Customer.phoneNumber)
+LOAN_COLUMNS = (Loan.id, Loan.custId, Loan.bookId, Loan.loanDate, Loan.expected_returnDate)
+LATE_LOAN_COLUMNS = LOAN_COLUMNS + (Loan.lateDays_num,)
+# output field names of the list endpoints, in column order
+BOOK_FIELDS = tuple(column.key for column in BOOK_COLUMNS)
+LOAN_FIELDS = tuple(column.key for column in LOAN_COLUMNS)
+LATE_LOAN_FIELDS = tuple(column.key for column in LATE_LOAN_COLUMNS)
+
+def active_books_query(db):
+    return db.query(*BOOK_COLUMNS).filter(Book.active == True)
+
+def active_customers_query(db):
+    return db.query(*CUSTOMER_COLUMNS).filter(Customer.active == True)
+
+def active_loans_query(db):
+    return db.query(*LOAN_COLUMNS).filter(Loan.active == True)
+
+def late_loans_query(db):
+    return db.query(*LATE_LOAN_COLUMNS).filter(and_(Loan.active == True, Loan.isLate == True))
+
+def row_objects(rows, fields):
+    # zips each result row onto the field names; columns past the last field (a trailing
+    # pagination key) are left out
+    return [dict(zip(fields, row)) for row in rows]
+
+def encode_rows(rows, fields):
+    # ?shape=rows sends {"fields": [...], "rows": [[...], ...]}: the row tuples go to the
+    # encoder as they are, without a dict per row or repeated keys in the body
+    if request.args.get("shape") != "rows":
+        return row_objects(rows, fields)
+    width = len(fields)
+    return {"fields": fields, "rows": [row[:width] for row in rows]}
+
+def page_response(items, next_cursor, sync_version=None):
+    response = jsonify(items)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    if sync_version is not None:
+        response.headers["X-Sync-Version"] = str(sync_version)
+    return response
+
+def current_sync_version(db):
+    return db.query(Counter.value).filter(Counter.name == "sync_version").scalar() or 0
+
+def wants_changes():
+    return request.args.get("since") is not None
+
+def changes_response(db, query, model, serialize):
+    # ?since=<version>: every row of the list changed after that version, ordered by version.
+    # Rows that left the list (soft-deleted, or returned for loans) come back as tombstones.
+    since = request.args.get("since", 0, type=int)
+    sync_version = current_sync_version(db)
+    # rows stamped after the counter was read are left for the next sync
+    query = query.add_columns(model.active, model.version).filter(
+        model.version > since, model.version <= sync_version).order_by(model.version)
+    rows, next_cursor = first_page(query, request.args.get("limit", type=int), cursor="version")
+    items = [dict(serialize(row), version=row.version) if row.active else {"id": row.id, "deleted": True, "version": row.version}
+             for row in rows]
+    return page_response(items, next_cursor, next_cursor if next_cursor is not None else sync_version)
+
+@bp.route("/")
 def hello():
     logger.debug("Hello endpoint accessed")
     return {"msg":"hello!"}
 
-@app.route("/books", methods=["GET", "POST", "DELETE", "PUT"])
+# The plain GET pages of the read endpoints take the session as their only argument, so the
+# async serving mode (asgi.py) runs the very same code through AsyncSession.run_sync.
+def books_page(db):
+    sync_version = current_sync_version(db)
+    books, next_cursor = paginate(active_books_query(db), Book.id)
+    return page_response(encode_rows(books, BOOK_FIELDS), next_cursor, sync_version)
+
+def loans_page(db):
+    sync_version = current_sync_version(db)
+    loans, next_cursor = paginate(active_loans_query(db), Loan.id)
+    logger.info("Fetched all active loans")
+    return page_response(encode_rows(loans, LOAN_FIELDS), next_cursor, sync_version)
+
+def late_loans_page(db):
+    loans, next_cursor = paginate(late_loans_query(db), Loan.id)
+    logger.info("Fetched all late loans")
+    return page_response(encode_rows(loans, LATE_LOAN_FIELDS), next_cursor)
+
+def find_books_page(db):
+    logger.info("find book succeded!")
+    name = request.args.get("name")
+    author = request.args.get("author")
+    publishYear = request.args.get("publishYear")
+
+    query = db.query(*BOOK_COLUMNS)
+    filters = [Book.active == True]
+    if publishYear:
+        filters.append(Book.publishYear == publishYear)
+
+    text_fields = {field: value for field, value in (("name", name), ("author", author)) if value}
+    match = None if use_substring_search() else fts_match_expression(text_fields)
+
+    if match:
+        query = ranked_matches(query, books_fts, Book, match, narrowed=bool(publishYear))
+    else:
+        for field, value in text_fields.items():
+            filters.append(getattr(Book, field).ilike(f"%{value}%"))
+        query = query.order_by(Book.id)
+
+    # the best `limit` matches (DEFAULT_PAGE_LIMIT, at most MAX_PAGE_LIMIT)
+    books = query.filter(and_(*filters)).limit(page_limit(request.args.get("limit", type=int))).all()
+    return jsonify(encode_rows(books, BOOK_FIELDS))
+
+def customer_books_page(db):
+    username = get_jwt_identity()
+    logger.info("findCustomersBooks accessed by username: %s", username)
+
+    identity = current_identity(db)
+    if not identity:
+        logger.warning("User not found: %s", username)
+        return jsonify({"error": "User not found"}), 404
+
+    query = db.query(Book.name, Book.author, Book.publishYear, Loan.isLate, Loan.id).join(
+        Book, Book.id == Loan.bookId).filter(Loan.custId == identity["id"])
+    if request.args.get("active") in ("1", "true"):
+        query = query.filter(Loan.active == True)
+    else:
+        # archived loans keep their ids, so one id-ordered page spans both tables
+        query = query.union_all(db.query(Book.name, Book.author, Book.publishYear, LoanHistory.isLate, LoanHistory.id).join(
+            Book, Book.id == LoanHistory.bookId).filter(LoanHistory.custId == identity["id"]))
+    loans, next_cursor = paginate(query, Loan.id)
+
+    logger.info("Loaned books retrieved for username: %s", username)
+    return page_response(encode_rows(loans, ("book_name", "author", "publish_year", "isLate")), next_cursor)
+
+def guest_watch_list_page(db):
+    logger.info("Guest watch list accessed")
+    query = db.query(Book.name, Book.author, Book.publishYear, Book.isLoaned, Book.id).filter(Book.active == True)
+    books, next_cursor = paginate(query, Book.id)
+    return page_response(encode_rows(books, ("name", "author", "publishYear", "isLoaned")), next_cursor)
+
+@bp.route("/books", methods=["GET", "POST", "DELETE", "PUT"])
+@response_cache.cached("catalog")
 def books_endpoint():
-    db = get_db_session()
+    db = get_db_session(readonly=request.method == 'GET')
     try:
         if request.method == 'GET':
-            books = db.query(Book).filter(Book.active == True).all()
-            return jsonify([{
-                "id": Book.id,
-                "name": Book.name,
-                "author": Book.author,
-                "publishYear": Book.publishYear,
-                "bookLoanType": Book.bookLoanType,
-                "isLoaned": Book.isLoaned
-            }
-            for Book in books])
+            if wants_changes():
+                return changes_response(db, db.query(*BOOK_COLUMNS), Book, serialize_book)
+            if wants_stream():
+                return stream_response(active_books_query(db), Book.id, serialize_book)
+            return books_page(db)
 
         if request.method == 'POST':
-            data = request.get_json()
-            name = data.get("name")
-            author = data.get("author")
-            publishYear = data.get("publishYear")
-            bookLoanType = data.get("bookLoanType")
-
-            current_year = datetime.now().year
-
-            if not name or not author or not publishYear or not bookLoanType:
-                return jsonify({"error": "Missing required fields"}), 400
-            
-            if len(name) < 2 or len(name) > 100:
-                return jsonify({"error": "Book Name should be between 3 to 100 characters."}), 400
-       
-            if len(author) < 3 or len(author) > 100:
-                return jsonify({"error": "Author Name should be between 3 to 100 characters."}), 400
-            
-            if not publishYear or int(publishYear) < 1000 or int(publishYear) > datetime.now().year:
-                return jsonify({"error": "Publish Year must be a valid year between 1000 and the current year."}), 400
-
-            if not bookLoanType or int(bookLoanType) < 1 or int(bookLoanType) > 3:
-                return jsonify({"error": "Loan Type must be a positive number between 1 and 3."}), 400
+            book_fields, error = validate_book(request.get_json())
+            if error:
+                return jsonify({"error": error}), 400
 
             try:
-                new_book = Book(name=name, author=author, publishYear=publishYear, bookLoanType=bookLoanType, isLoaned=False, active=True)
+                new_book = Book(**book_fields)
                 db.add(new_book)
                 db.commit()
                 return jsonify({'status': 201, 'message': 'Book created successfully'}), 201
             except Exception as e:
-                print(f"Error occurred while adding book: {e}")
+                logger.error("Error occurred while adding book: %s", e)
                 return jsonify({"error": "Failed to create book due to internal error."}), 500
         
         if request.method == 'DELETE':
@@ -167,12 +1619,13 @@ def books_endpoint():
             id = data.get("id")
 
             book = db.query(Book).filter(Book.id == id).first()
-            if Book:
+            if book:
                 book.active = False
                 db.commit()
-                logger.info(f"Deleted book with ID: {book_id}")
+                event_bus.publish("book.deleted", {"id": book.id})
+                logger.info("Deleted book with ID: %s", id)
                 return jsonify({"message": "Book deleted successfully"})
-            logger.warning(f"Book with ID {book_id} not found for deletion")
+            logger.warning("Book with ID %s not found for deletion", id)
             return jsonify({"error": "Book bot found"}),404
 
         if request.method == 'PUT':
@@ -180,112 +1633,62 @@ def books_endpoint():
             id = data.get('id')
             custId = data.get("custId")
 
-            book = db.query(Book).filter(Book.id == id).first()
-            customer = db.query(Customer).filter(Customer.id == custId).first()
-            
-            loanDate = datetime.today().date()        
-            if book:
-                loanType = db.query(Type).filter(Type.loanType == book.bookLoanType).first()
-                loanType = db.query(Type).filter(Type.loanType == book.bookLoanType).first()
-                if not loanType:
-                    return jsonify({"error": "Invalid loan type"}), 400
-                numOfDays = loanType.num_of_days
-                expected_returnDate = loanDate + timedelta(days=numOfDays)
-
-                if book.isLoaned == 0:
-                    book.isLoaned = True
-                    new_loan = Loan(bookId=id, custId=custId, loanDate=loanDate, expected_returnDate=expected_returnDate, returnDate=None, lateDays_num=0)
-                    db.add(new_loan)
+            book = db.query(Book.bookLoanType).filter(Book.id == id, Book.active == True).first()
+            if not book:
+                logger.warning("Book with ID %s not found for update", id)
+                return jsonify({"error": "loan not found"}), 404
+            loanType = db.query(Type).filter(Type.loanType == book.bookLoanType).first()
+            if not loanType:
+                return jsonify({"error": "Invalid loan type"}), 400
+
+            # claim the book with a conditional UPDATE; whichever request flips isLoaned wins
+            # and every other concurrent checkout sees zero affected rows
+            claimed = db.execute(update(Book).where(Book.id == id, Book.isLoaned == False).values(isLoaned=True)).rowcount
+            if not claimed:
+                db.rollback()
+                return jsonify({"error": "Book is already loaned"}), 409
+            loanDate = datetime.today().date()
+            expected_returnDate = loanDate + timedelta(days=loanType.num_of_days)
+            new_loan = Loan(bookId=id, custId=custId, loanDate=loanDate, expected_returnDate=expected_returnDate,
+                            returnDate=None, lateDays_num=0)
+            db.add(new_loan)
+            try:
                 db.commit()
-                logger.info(f"Updated book: {book}")
-                return jsonify({"message": "loan updated successfully"})
-            logger.warning(f"Book with ID {book_id} not found for update")
-            return jsonify({"error": "loan not found"}), 404
+            except IntegrityError:
+                # ux_loans_active_bookId: an active loan already exists even though the flag said otherwise
+                db.rollback()
+                logger.warning("Book with ID %s already has an active loan", id)
+                return jsonify({"error": "Book is already loaned"}), 409
+            publish_loan_change("loan.checkout", serialize_loan(new_loan))
+            logger.info("Updated book with ID: %s", id)
+            return jsonify({"message": "loan updated successfully"})
     except Exception as e:
-        logger.error(f"Error in books endpoint: {e}")
+        logger.error("Error in books endpoint: %s", e)
     return jsonify({"error": "An error occurred"}), 500
 
 
-@app.route("/customers", methods=["GET", "POST", "DELETE", "PUT"])
+@bp.route("/customers", methods=["GET", "POST", "DELETE", "PUT"])
 def customers_endpoint():
-    db = get_db_session()
+    db = get_db_session(readonly=request.method == 'GET')
     try:
         if request.method == 'GET':
-            customers = db.query(Customer).filter(Customer.active == True).all()
-            today = datetime.today()
-            updated_customers = []
-
-            for customer in customers:
-                calculated_age = (
-                    today.year - customer.birthDate.year
-                    - ((today.month, today.day) < (customer.birthDate.month, customer.birthDate.day))
-                )
-                
-                if customer.age != calculated_age:
-                    customer.age = calculated_age
-                    updated_customers.append(customer)
-
-            if updated_customers:
-                db.commit()
-                logger.info(f"Updated ages for {len(updated_customers)} customers.")
-
-            return jsonify([{
-                "id": Customer.id,
-                "firstName": Customer.firstName,
-                "lastName": Customer.lastName,
-                "age": Customer.age,
-                "city": Customer.city,
-                "email": Customer.email,
-                "phoneNumber": Customer.phoneNumber
-            }
-            for Customer in customers])
+            if wants_changes():
+                return changes_response(db, db.query(*CUSTOMER_COLUMNS), Customer, serialize_customer)
+            query = active_customers_query(db)
+            if wants_stream():
+                return stream_response(query, Customer.id, serialize_customer)
+            sync_version = current_sync_version(db)
+            customers, next_cursor = paginate(query, Customer.id)
+            return page_response([serialize_customer(customer) for customer in customers], next_cursor, sync_version)
         
         if request.method == 'POST':
-            data = request.get_json()
-            firstName = data.get("firstName")
-            lastName = data.get("lastName")
-            birthDate = data.get("birthDate")
-            city = data.get("city")
-            email = data.get("email")
-            phoneNumber = data.get("phoneNumber")
-            username = data.get("username")
-            password = data.get("password")
-            role = data.get("role", "user")
-
-            if not all([firstName, lastName, birthDate, city, email, phoneNumber, username, password]):
-                return jsonify({"error": "All fields are required."}), 400
-
-            if not firstName or len(firstName) < 3:
-                return jsonify({"error": "First name must be at least 3 characters long."}), 400
-
-            if not lastName or len(lastName) < 3:
-                return jsonify({"error": "Last name must be at least 3 characters long."}), 400
-
-            if not birthDate:
-                return jsonify({"error": "Birthdate is required."}), 400
-            try:
-                birthDate_obj = datetime.strptime(birthDate, '%Y-%m-%d').date()
-            except ValueError:
-                return jsonify({"error": "Birthdate must be in the format YYYY-MM-DD."}), 400
+            customer_fields, error = validate_customer(request.get_json())
+            if error:
+                return jsonify({"error": error}), 400
+            username = customer_fields["username"]
+            email = customer_fields["email"]
+            phoneNumber = customer_fields["phoneNumber"]
 
-            today = datetime.today()
-            calculated_age = today.year - birthDate_obj.year - ((today.month, today.day) < (birthDate_obj.month, birthDate_obj.day))
-
-            if calculated_age < 5 or calculated_age > 120:
-                return jsonify({"error": "Age must be between 5 and 120."}), 400
-
-            age = calculated_age
-
-            if not city or len(city) < 2:
-                return jsonify({"error": "City must be at least 2 characters long."}), 400
-
-            if not email or not validate_email(email):
-                return jsonify({"error": "Please provide a valid email address."}), 400
-            
-            phone_regex = r'^[\d\s\-+()]{10,15}$'
-            if not phoneNumber or not re.match(phone_regex, phoneNumber):
-                return jsonify({"error": "Phone number must be between 10 and 15 characters and include digits, spaces, '-', '+', or '()'."}), 400
-            
             if db.query(Customer).filter(Customer.username == username).first():
                  return jsonify({"error": "Username is already taken."}), 400
             if db.query(Customer).filter_by(email=email).first():
@@ -293,23 +1696,11 @@ def customers_endpoint():
             if db.query(Customer).filter_by(phoneNumber=phoneNumber).first():
                 return jsonify({"error": "Phone number is already registered."}), 400
             
-            hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
-            new_customer = Customer(
-                    firstName=firstName,
-                    lastName=lastName,
-                    age=age,
-                    birthDate=birthDate_obj,
-                    city=city,
-                    email=email,
-                    phoneNumber=phoneNumber,
-                    username=username,
-                    password=hashed_password,
-                    role=role,
-                    active=True
-                )
+            customer_fields["password"] = hash_pool.generate_password_hash(customer_fields["password"])
+            new_customer = Customer(**customer_fields)
             db.add(new_customer)
             db.commit()
-            logger.info(f"Added new customer: {new_customer}")
+            logger.info("Added new customer with ID: %s", new_customer.id)
             return jsonify({'status': 201, 'message': 'Customer created successfully'}), 201
         
         if request.method == 'DELETE':
@@ -320,9 +1711,10 @@ def customers_endpoint():
             if customer:
                 customer.active = False
                 db.commit()
-                logger.info(f"Deleted customer with ID: {customer_id}")
+                identity_cache.expire()
+                logger.info("Deleted customer with ID: %s", id)
                 return jsonify({"message": "Customer deleted successfully"})
-            logger.warning(f"Customer with ID {customer_id} not found for deletion")
+            logger.warning("Customer with ID %s not found for deletion", id)
             return jsonify({"error": "Customer bot found"}),404
         
         if request.method == 'PUT':
@@ -374,7 +1766,7 @@ def customers_endpoint():
                     return jsonify({"error": "Phone number must be between 10 and 15 characters and include digits, spaces, '-', '+', or '()'."}), 400
 
                 if password:
-                    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+                    hashed_password = hash_pool.generate_password_hash(password)
                     customer.password = hashed_password
 
                 if new_firstName:
@@ -395,31 +1787,31 @@ def customers_endpoint():
                     customer.role = role
 
                 db.commit()
-                logger.info(f"Updated customer: {customer}")
+                identity_cache.expire()
+                logger.info("Updated customer with ID: %s", customer.id)
                 return jsonify({"message": "Customer updated successfully"})
-            logger.warning(f"Customer with ID {id} not found for update")
+            logger.warning("Customer with ID %s not found for update", id)
             return jsonify({"error": "Customer not found"}), 404
+    except HashPoolSaturated:
+        raise
     except Exception as e:
-        logger.error(f"Error in customers endpoint: {e}")
+        logger.error("Error in customers endpoint: %s", e)
         return jsonify({"error": "An error occurred"}), 500
 
 
-
-@app.route("/loans", methods=["GET", "POST", "DELETE", "PUT"])
+@bp.route("/loans", methods=["GET", "POST", "DELETE", "PUT"])
 def loans_endpoint():
-    db = get_db_session()
+    db = get_db_session(readonly=request.method == 'GET')
     try:
         if request.method == 'GET':
-            loans = db.query(Loan).filter(Loan.active == True).all()
-            logger.info("Fetched all active loans")
-            return jsonify([{
-                "id": Loan.id,
-                "custId": Loan.custId,
-                "bookId": Loan.bookId,
-                "loanDate": Loan.loanDate.strftime('%Y-%m-%d'),
-                "expected_returnDate": Loan.expected_returnDate.strftime('%Y-%m-%d'),
-            }
-            for Loan in loans])
+            if wants_changes():
+                if request.args.get("since", 0, type=int) < archived_loans_version(db):
+                    return jsonify({"error": "Changes this old have been archived, reload the full list"}), 410
+                return changes_response(db, db.query(*LOAN_COLUMNS), Loan, serialize_loan)
+            if wants_stream():
+                logger.info("Streaming all active loans")
+                return stream_response(active_loans_query(db), Loan.id, serialize_loan)
+            return loans_page(db)
 
         #post is in books.
 
@@ -431,51 +1823,231 @@ def loans_endpoint():
             today = datetime.today().date()
 
             if loan:
-                loan.active = False
-                loan.returnDate = today
-                if today > loan.expected_returnDate: 
-                    late_days = (today - loan.expected_returnDate).days
-                    
-                    loan.isLate = True
-                    loan.lateDays_num = late_days
+                if not loan.active:
+                    logger.warning("Loan with ID %s was already returned", id)
+                    return jsonify({"error": "Loan already returned"}), 409
+                # only a loan the overdue sweep flagged is in the overdue_loans count
+                flagged = loan.isLate
+                returned = {"active": False, "returnDate": today}
+                if today > loan.expected_returnDate:
+                    returned.update(isLate=True, lateDays_num=(today - loan.expected_returnDate).days)
+                # close the loan with a conditional UPDATE, like checkout claims the book, so two
+                # concurrent returns of the same loan cannot both count it or free its book
+                closed = db.execute(update(Loan).where(Loan.id == id, Loan.active == True).values(**returned)).rowcount
+                if not closed:
+                    db.rollback()
+                    logger.warning("Loan with ID %s was already returned", id)
+                    return jsonify({"error": "Loan already returned"}), 409
+                if flagged:
+                    bump_counter(db, "overdue_loans", -1)
                 book = db.query(Book).filter(Book.id == loan.bookId).first()
                 if book:
                     book.isLoaned = False
                 db.commit()
-                logger.info(f"Deleted loan with ID: {id}")
+                publish_loan_change("loan.return", {"id": loan.id, "custId": loan.custId, "bookId": loan.bookId})
+                logger.info("Deleted loan with ID: %s", id)
                 return jsonify({"message": "Loan deleted successfully"})
-            logger.warning(f"Loan with ID {id} not found for deletion")
+            logger.warning("Loan with ID %s not found for deletion", id)
             return jsonify({"error": "Loan not found"}),404
 
     except Exception as e:
-        logger.error(f"Error in loans endpoint: {e}")
+        logger.error("Error in loans endpoint: %s", e)
         return jsonify({"error": "An error occurred"}), 500
 
 
-@app.route("/lateLoans", methods=["GET"])
-def lateLoans_endpoint():
+def batch_request():
+    data = request.get_json() or {}
+    custId = data.get("custId")
+    bookIds = data.get("bookIds")
+    if not custId or not isinstance(bookIds, list) or not bookIds:
+        return None, None, "custId and a non-empty bookIds list are required."
+    try:
+        return int(custId), list(dict.fromkeys(int(book_id) for book_id in bookIds)), None
+    except (TypeError, ValueError):
+        return None, None, "custId and bookIds must be integers."
+
+def batch_report(results):
+    failed = sum(1 for result in results if "error" in result)
+    return {"succeeded": len(results) - failed, "failed": failed, "results": results}
+
+
+@bp.route("/loans/checkout", methods=["POST"])
+def checkout_batch_endpoint():
+    db = get_db_session()
+    try:
+        custId, bookIds, error = batch_request()
+        if error:
+            return jsonify({"error": error}), 400
+        if not db.query(Customer.id).filter(Customer.id == custId, Customer.active == True).first():
+            return jsonify({"error": "Customer not found"}), 404
+
+        loan_days = dict(db.query(Type.loanType, Type.num_of_days).all())
+        books = {book.id: book for book in db.query(Book.id, Book.bookLoanType, Book.isLoaned).filter(
+            Book.id.in_(bookIds), Book.active == True)}
+        errors = {}
+        for book_id in bookIds:
+            book = books.get(book_id)
+            if not book:
+                errors[book_id] = "Book not found"
+            elif book.bookLoanType not in loan_days:
+                errors[book_id] = "Invalid loan type"
+        candidates = [book_id for book_id in bookIds if book_id not in errors]
+
+        # the isLoaned = 0 condition makes the UPDATE the arbiter: only rows it actually flipped get a loan
+        checked_out = set()
+        if candidates:
+            checked_out = set(db.execute(update(Book).where(
+                Book.id.in_(candidates), Book.isLoaned == False).values(isLoaned=True).returning(Book.id)).scalars())
+        loanDate = datetime.today().date()
+        new_loans = [{
+            "custId": custId, "bookId": book_id, "loanDate": loanDate,
+            "expected_returnDate": loanDate + timedelta(days=loan_days[books[book_id].bookLoanType]),
+            "returnDate": None, "lateDays_num": 0, "isLate": False, "active": True
+        } for book_id in candidates if book_id in checked_out]
+        loan_ids = {}
+        if new_loans:
+            loan_ids = dict(db.execute(insert(Loan.__table__).returning(Loan.bookId, Loan.id), new_loans).all())
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            logger.warning("Batch checkout for customer %s conflicts with an active loan", custId)
+            return jsonify({"error": "One of the books already has an active loan"}), 409
+        for fields in new_loans:
+            publish_loan_change("loan.checkout", {
+                "id": loan_ids[fields["bookId"]], "custId": custId, "bookId": fields["bookId"],
+                "loanDate": fields["loanDate"], "expected_returnDate": fields["expected_returnDate"]})
+
+        results = []
+        for book_id in bookIds:
+            if book_id in checked_out:
+                results.append({"bookId": book_id, "status": "loaned"})
+            else:
+                results.append({"bookId": book_id, "error": errors.get(book_id, "Book is already loaned")})
+        logger.info("Batch checkout for customer %s: %s of %s books", custId, len(new_loans), len(bookIds))
+        return jsonify(batch_report(results))
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error("Error in batch checkout: %s", e)
+        return jsonify({"error": "An error occurred"}), 500
+
+
+@bp.route("/loans/return", methods=["POST"])
+def return_batch_endpoint():
     db = get_db_session()
+    try:
+        custId, bookIds, error = batch_request()
+        if error:
+            return jsonify({"error": error}), 400
+
+        loans = db.query(Loan.id, Loan.bookId, Loan.isLate).filter(
+            Loan.custId == custId, Loan.bookId.in_(bookIds), Loan.active == True).all()
+        loan_ids = [loan.id for loan in loans]
+        today = datetime.today().date()
+        returned = {}
+        if loan_ids:
+            overdue = Loan.expected_returnDate < today
+            returned = dict(db.execute(update(Loan).where(Loan.id.in_(loan_ids), Loan.active == True).values(
+                active=False,
+                returnDate=today,
+                isLate=case((overdue, True), else_=Loan.isLate),
+                lateDays_num=case((overdue, late_days_expression(today)), else_=Loan.lateDays_num)
+            ).returning(Loan.bookId, Loan.id)).all())
+            db.execute(update(Book).where(Book.id.in_(returned)).values(isLoaned=False))
+            # loans the overdue sweep had already flagged are leaving the overdue set
+            bump_counter(db, "overdue_loans", -sum(1 for loan in loans if loan.isLate and loan.bookId in returned))
+        db.commit()
+        for book_id, loan_id in returned.items():
+            publish_loan_change("loan.return", {"id": loan_id, "custId": custId, "bookId": book_id})
+
+        results = [{"bookId": book_id, "status": "returned"} if book_id in returned
+                   else {"bookId": book_id, "error": "No active loan for this book"} for book_id in bookIds]
+        logger.info("Batch return for customer %s: %s of %s books", custId, len(returned), len(bookIds))
+        return jsonify(batch_report(results))
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error("Error in batch return: %s", e)
+        return jsonify({"error": "An error occurred"}), 500
+
+
+@bp.route("/lateLoans", methods=["GET"])
+def lateLoans_endpoint():
+    db = get_db_session(readonly=True)
     try:
         if request.method == 'GET':
-            loans = db.query(Loan).filter(and_(Loan.active == True, Loan.isLate == True)).all()
-            logger.info("Fetched all late loans")
-            return jsonify([{
-                "id": Loan.id,
-                "custId": Loan.custId,
-                "bookId": Loan.bookId,
-                "loanDate": Loan.loanDate.strftime('%Y-%m-%d'),
-                "expected_returnDate": Loan.expected_returnDate.strftime('%Y-%m-%d'),
-                "lateDays_num": Loan.lateDays_num
-            }
-            for Loan in loans])
+            if wants_stream():
+                logger.info("Streaming all late loans")
+                return stream_response(late_loans_query(db), Loan.id, serialize_late_loan)
+            return late_loans_page(db)
     except Exception as e:
-        logger.error(f"Error in lateLoans endpoint: {e}")
+        logger.error("Error in lateLoans endpoint: %s", e)
         return jsonify({"error": "An error occurred"}), 500
 
 
-@app.route("/findCustomer", methods=["GET"])
+DASHBOARD_COUNTERS = {
+    "books": "books_active",
+    "loaned": "books_loaned",
+    "overdue": "overdue_loans",
+    "activeCustomers": "customers_active",
+}
+
+@bp.route("/dashboard", methods=["GET"])
+def dashboard_endpoint():
+    # everything the manager dashboard needs on load: the first page of each list and the headline counts
+    db = get_db_session(readonly=True)
+    try:
+        limit = request.args.get("limit", type=int)
+        sections = {}
+        for key, query, id_column, fields in (("books", active_books_query(db), Book.id, BOOK_FIELDS),
+                                              ("customers", active_customers_query(db), Customer.id, None),
+                                              ("loans", active_loans_query(db), Loan.id, LOAN_FIELDS),
+                                              ("lateLoans", late_loans_query(db), Loan.id, LATE_LOAN_FIELDS)):
+            rows, next_cursor = first_page(query.order_by(id_column), limit)
+            items = row_objects(rows, fields) if fields else [serialize_customer(row) for row in rows]
+            sections[key] = {"items": items, "nextCursor": next_cursor}
+        counters = dict(db.query(Counter.name, Counter.value).filter(Counter.name.in_(DASHBOARD_COUNTERS.values())).all())
+        sections["counts"] = {key: counters.get(name, 0) for key, name in DASHBOARD_COUNTERS.items()}
+        return jsonify(sections)
+    except Exception as e:
+        logger.error("Error in dashboard endpoint: %s", e)
+        return jsonify({"error": "An error occurred"}), 500
+
+
+@bp.route("/events", methods=["GET"])
+def events_endpoint():
+    # Server-Sent Events: loan.checkout, loan.return, book.availability and book.deleted as they happen
+    try:
+        subscription = event_bus.subscribe(request.headers.get("Last-Event-ID", type=int))
+    except EventBusFull:
+        response = jsonify({"error": "Too many event subscribers, try again later"})
+        response.headers["Retry-After"] = str(current_app.config["EVENT_KEEPALIVE"])
+        return response, 503
+    keepalive = current_app.config["EVENT_KEEPALIVE"]
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                if subscription.overflowed:
+                    # this client fell too far behind; it must reload its lists and reconnect
+                    yield "event: resync\ndata: {}\n\n"
+                    return
+                try:
+                    event = subscription.queue.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_event(*event)
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@bp.route("/findCustomer", methods=["GET"])
 def findCustomer():
-    db = get_db_session()
+    db = get_db_session(readonly=True)
     try:
         if request.method == 'GET':
             firstName = request.args.get("firstName")
@@ -487,86 +2059,55 @@ def findCustomer():
             role = request.args.get("role")
             id = request.args.get("id")
 
-            filters = []
-            if firstName:
-                filters.append(Customer.firstName.ilike(f"%{firstName}%"))
-            if lastName:
-                filters.append(Customer.lastName.ilike(f"%{lastName}%"))
-            if email:
-                filters.append(Customer.email.ilike(f"%{email}%"))
-            if phoneNumber:
-                filters.append(Customer.phoneNumber.ilike(f"%{phoneNumber}%"))
-            if city:
-                filters.append(Customer.city.ilike(f"%{city}%"))
+            query = db.query(Customer.id, Customer.firstName, Customer.lastName, Customer.birthDate, Customer.city,
+                             Customer.email, Customer.phoneNumber, Customer.username, Customer.role)
+            filters = [Customer.active == True]
             if id:
                 filters.append(Customer.id == int(id))
-            if username:
-                filters.append(Customer.username.ilike(f"%{username}%"))
             if role:
                 filters.append(Customer.role == role)
 
-            customers = db.query(Customer).filter(and_(*filters)).all()
-            logger.info(f"Fetched {len(customers)} customers based on search filters")
-            return jsonify([{
-                "id": customer.id,
-                "firstName": customer.firstName,
-                "lastName": customer.lastName,
-                "age": customer.age,
-                "city": customer.city,
-                "email": customer.email,
-                "phoneNumber": customer.phoneNumber,
-                "username": customer.username,
-                "role": customer.role
-            } for customer in customers])
+            text_fields = {"firstName": firstName, "lastName": lastName, "email": email, "phoneNumber": phoneNumber,
+                           "city": city, "username": username}
+            text_fields = {name: value for name, value in text_fields.items() if value}
+            match = None if use_substring_search() else fts_match_expression(text_fields)
+
+            if match:
+                query = ranked_matches(query, customers_fts, Customer, match, narrowed=bool(id or role))
+            else:
+                for field, value in text_fields.items():
+                    filters.append(getattr(Customer, field).ilike(f"%{value}%"))
+                query = query.order_by(Customer.id)
+
+            customers = query.filter(and_(*filters)).limit(page_limit(request.args.get("limit", type=int))).all()
+            logger.info("Fetched %s customers based on search filters", len(customers))
+            return jsonify([dict(serialize_customer(customer), username=customer.username, role=customer.role)
+                            for customer in customers])
 
     except Exception as e:
-        logger.error(f"Error in findCustomer endpoint: {e}")
+        logger.error("Error in findCustomer endpoint: %s", e)
         return jsonify({"error": "An error occurred"}), 500
 
 
-@app.route("/findBook", methods=["GET"])
+@bp.route("/findBook", methods=["GET"])
 def findBook():
-    db = get_db_session()
+    db = get_db_session(readonly=True)
     try:
         if request.method == 'GET':
-            logger.info(f"find book succeded!")
-            name = request.args.get("name")
-            author = request.args.get("author")
-            publishYear = request.args.get("publishYear")
-
-            filters = []
-            if name:
-                filters.append(Book.name.ilike(f"%{name}%"))
-            if author:
-                filters.append(Book.author.ilike(f"%{author}%"))
-            if publishYear:
-                filters.append(Book.publishYear == publishYear)
-
-
-            books = db.query(Book).filter(and_(*filters)).all()
-
-            return jsonify([{
-                "id": Book.id,
-                "name": Book.name,
-                "author": Book.author,
-                "publishYear": Book.publishYear,
-                "bookLoanType": Book.bookLoanType,
-                "isLoaned": Book.isLoaned
-            }
-            for Book in books])
+            return find_books_page(db)
 
     except Exception as e:
-        logger.error(f"Error in findBook endpoint: {e}")
+        logger.error("Error in findBook endpoint: %s", e)
         return jsonify({"error": "An error occurred"}), 500
 
-@app.route("/customerToUpdate", methods=["GET"])
+@bp.route("/customerToUpdate", methods=["GET"])
 def getCustomerData():
-    db = get_db_session()
+    db = get_db_session(readonly=True)
     try:
         if request.method == 'GET':
             id = int(request.args.get('id'))
             customer = db.query(Customer).filter(Customer.id == id).first()
-            logger.info(f"Fetched customer data for ID: {id}")
+            logger.info("Fetched customer data for ID: %s", id)
             formatted_birth_date = customer.birthDate.strftime("%Y-%m-%d") if customer.birthDate else None
             
             return jsonify({
@@ -581,21 +2122,262 @@ def getCustomerData():
             })
 
     except Exception as e:
-        logger.error(f"Error fetching customer data: {e}")
+        logger.error("Error fetching customer data: %s", e)
         return jsonify({"error": "An error occurred"}), 500
 
 def validate_email(email):
     email_regex = r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$'
     return re.match(email_regex, email) is not None
 
+def validate_book(data):
+    name = data.get("name")
+    author = data.get("author")
+    publishYear = data.get("publishYear")
+    bookLoanType = data.get("bookLoanType")
+
+    if not name or not author or not publishYear or not bookLoanType:
+        return None, "Missing required fields"
+
+    # JSON and NDJSON bodies can carry any type; only the numeric fields may be numbers
+    if not isinstance(name, str) or not isinstance(author, str):
+        return None, "Book Name and Author must be text."
+
+    if len(name) < 2 or len(name) > 100:
+        return None, "Book Name should be between 3 to 100 characters."
+
+    if len(author) < 3 or len(author) > 100:
+        return None, "Author Name should be between 3 to 100 characters."
 
-@app.route('/signup', methods=['POST'])
+    try:
+        publishYear = int(publishYear)
+    except (TypeError, ValueError, OverflowError):
+        publishYear = 0
+    if publishYear < 1000 or publishYear > datetime.now().year:
+        return None, "Publish Year must be a valid year between 1000 and the current year."
+
+    try:
+        bookLoanType = int(bookLoanType)
+    except (TypeError, ValueError, OverflowError):
+        bookLoanType = 0
+    if bookLoanType < 1 or bookLoanType > 3:
+        return None, "Loan Type must be a positive number between 1 and 3."
+
+    return {"name": name, "author": author, "publishYear": str(publishYear), "bookLoanType": bookLoanType,
+            "isLoaned": False, "active": True}, None
+
+def validate_customer(data):
+    firstName = data.get("firstName")
+    lastName = data.get("lastName")
+    birthDate = data.get("birthDate")
+    city = data.get("city")
+    email = data.get("email")
+    phoneNumber = data.get("phoneNumber")
+    username = data.get("username")
+    password = data.get("password")
+    role = data.get("role") or "user"
+
+    if not all([firstName, lastName, birthDate, city, email, phoneNumber, username, password]):
+        return None, "All fields are required."
+
+    if not all(isinstance(value, str) for value in (firstName, lastName, birthDate, city, email, phoneNumber,
+                                                     username, password, role)):
+        return None, "All fields must be text."
+
+    if len(firstName) < 3:
+        return None, "First name must be at least 3 characters long."
+
+    if len(lastName) < 3:
+        return None, "Last name must be at least 3 characters long."
+
+    try:
+        birthDate_obj = datetime.strptime(birthDate, '%Y-%m-%d').date()
+    except ValueError:
+        return None, "Birthdate must be in the format YYYY-MM-DD."
+
+    age = calculate_age(birthDate_obj)
+    if age < 5 or age > 120:
+        return None, "Age must be between 5 and 120."
+
+    if len(city) < 2:
+        return None, "City must be at least 2 characters long."
+
+    if not validate_email(email):
+        return None, "Please provide a valid email address."
+
+    phone_regex = r'^[\d\s\-+()]{10,15}$'
+    if not re.match(phone_regex, phoneNumber):
+        return None, "Phone number must be between 10 and 15 characters and include digits, spaces, '-', '+', or '()'."
+
+    return {"firstName": firstName, "lastName": lastName, "age": age, "birthDate": birthDate_obj, "city": city,
+            "email": email, "phoneNumber": phoneNumber, "username": username, "password": password, "role": role,
+            "active": True}, None
+
+
+BULK_BATCH_SIZE = 5000
+
+def parse_rows(stream, fmt):
+    # yields (row, parse_error) pairs without reading the whole upload into memory
+    text_stream = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    if fmt == "csv":
+        for row in csv.DictReader(text_stream):
+            yield row, None
+        return
+    for line in text_stream:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield None, f"Invalid JSON: {e}"
+            continue
+        yield (row, None) if isinstance(row, dict) else (None, "Each line must be a JSON object.")
+
+def upload_format(filename=None):
+    fmt = request.args.get("format")
+    if fmt:
+        return fmt
+    if filename:
+        return "csv" if filename.lower().endswith(".csv") else "ndjson"
+    return "csv" if request.mimetype == "text/csv" else "ndjson"
+
+def insert_books(db, batch):
+    rows = [fields for _, fields in batch]
+    with deferred_search_index(db, "books_fts"), deferred_sync_versions(db, "books", rows):
+        db.execute(insert(Book.__table__), rows)
+    return []
+
+def insert_customers(db, batch, seen):
+    # uniqueness is checked against earlier rows of the upload and against the table, one query per column
+    errors = []
+    checks = (("username", "Username is already taken."), ("email", "Email is already registered."),
+              ("phoneNumber", "Phone number is already registered."))
+    existing = {}
+    for field, _ in checks:
+        values = [fields[field] for _, fields in batch]
+        existing[field] = {value for (value,) in db.query(getattr(Customer, field)).filter(getattr(Customer, field).in_(values))}
+    accepted = []
+    for number, fields in batch:
+        error = next((message for field, message in checks
+                      if fields[field] in existing[field] or fields[field] in seen[field]), None)
+        if error:
+            errors.append({"row": number, "error": error})
+            continue
+        for field, _ in checks:
+            seen[field].add(fields[field])
+        accepted.append(fields)
+    hashes = hash_pool.generate_password_hashes([fields["password"] for fields in accepted])
+    for fields, hashed in zip(accepted, hashes):
+        fields["password"] = hashed
+    if accepted:
+        with deferred_search_index(db, "customers_fts"), deferred_sync_versions(db, "customers", accepted):
+            db.execute(insert(Customer.__table__), accepted)
+    return errors
+
+def import_rows(db, rows, validate, insert_batch):
+    report = {"inserted": 0, "failed": 0, "errors": []}
+    batch = []
+
+    def flush():
+        errors = insert_batch(db, batch)
+        db.commit()
+        report["inserted"] += len(batch) - len(errors)
+        report["failed"] += len(errors)
+        report["errors"].extend(errors)
+        batch.clear()
+
+    for number, (row, error) in enumerate(rows, start=1):
+        if error is None:
+            try:
+                fields, error = validate(row)
+            except Exception as e:
+                # a malformed row is reported like any other invalid row, never ends the import
+                logger.warning("Bulk import row %s could not be validated: %s", number, e)
+                error = "Invalid row."
+        if error:
+            report["failed"] += 1
+            report["errors"].append({"row": number, "error": error})
+            continue
+        batch.append((number, fields))
+        if len(batch) >= BULK_BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+    return report
+
+def import_books(db, rows):
+    return import_rows(db, rows, validate_book, insert_books)
+
+def import_customers(db, rows):
+    seen = {"username": set(), "email": set(), "phoneNumber": set()}
+    return import_rows(db, rows, validate_customer, lambda db, batch: insert_customers(db, batch, seen))
+
+def bulk_upload_rows():
+    upload = request.files.get("file")
+    if upload:
+        return parse_rows(upload.stream, upload_format(upload.filename))
+    return parse_rows(request.stream, upload_format())
+
+
+@bp.route("/books/bulk", methods=["GET", "POST"])
+def books_bulk_endpoint():
+    db = get_db_session(readonly=request.method == 'GET')
+    try:
+        if request.method == 'GET':
+            query = db.query(Book.id, Book.name, Book.author, Book.publishYear, Book.bookLoanType, Book.isLoaned).filter(Book.active == True)
+            return stream_response(query, Book.id, serialize_book, request.args.get("format", "ndjson"))
+
+        report = import_books(db, bulk_upload_rows())
+        logger.info("Bulk book import: %s inserted, %s failed", report["inserted"], report["failed"])
+        return jsonify(report), 200
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error("Error in books bulk endpoint: %s", e)
+        return jsonify({"error": "An error occurred"}), 500
+
+
+@bp.route("/customers/bulk", methods=["GET", "POST"])
+def customers_bulk_endpoint():
+    db = get_db_session(readonly=request.method == 'GET')
+    try:
+        if request.method == 'GET':
+            query = db.query(Customer.id, Customer.firstName, Customer.lastName, Customer.birthDate, Customer.city,
+                             Customer.email, Customer.phoneNumber).filter(Customer.active == True)
+            return stream_response(query, Customer.id, serialize_customer, request.args.get("format", "ndjson"))
+
+        report = import_customers(db, bulk_upload_rows())
+        logger.info("Bulk customer import: %s inserted, %s failed", report["inserted"], report["failed"])
+        return jsonify(report), 200
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error("Error in customers bulk endpoint: %s", e)
+        return jsonify({"error": "An error occurred"}), 500
+
+
+@bp.cli.command("import-books")
+@click.argument("path")
+def import_books_command(path):
+    with open(path, "rb") as f:
+        report = import_books(get_db_session(), parse_rows(f, "csv" if path.lower().endswith(".csv") else "ndjson"))
+    current_db().session.remove()
+    print(json.dumps(report, indent=2))
+
+
+@bp.cli.command("import-customers")
+@click.argument("path")
+def import_customers_command(path):
+    with open(path, "rb") as f:
+        report = import_customers(get_db_session(), parse_rows(f, "csv" if path.lower().endswith(".csv") else "ndjson"))
+    current_db().session.remove()
+    print(json.dumps(report, indent=2))
+
+
+@bp.route('/signup', methods=['POST'])
 def signup():
     db = get_db_session()
     logger.info("Signup endpoint accessed")
     if request.method == 'POST':
         data = request.get_json()
-        logger.debug(f"Received signup data: {data}")
+        logger.debug("Received signup data for username: %s", data.get("username"))
         firstName = data.get("firstName")
         lastName = data.get("lastName")
         birthDate = data.get("birthDate")
@@ -617,23 +2399,23 @@ def signup():
                 (today.month, today.day) < (birthDate_obj.month, birthDate_obj.day)
             )
             if calculated_age < 5 or calculated_age > 120:
-                logger.warning(f"Invalid age: {calculated_age}")
+                logger.warning("Invalid age: %s", calculated_age)
                 return jsonify({"error": "Age must be between 5 and 120."}), 400
         except ValueError:
-            logger.error(f"Invalid birthdate format: {birthDate}")
+            logger.error("Invalid birthdate format: %s", birthDate)
             return jsonify({"error": "Birthdate must be in the format YYYY-MM-DD."}), 400
 
         if db.query(Customer).filter(Customer.username == username).first():
-            logger.warning(f"Username already taken: {username}")
+            logger.warning("Username already taken: %s", username)
             return jsonify({"error": "Username is already taken."}), 400
         if db.query(Customer).filter_by(email=email).first():
-            logger.warning(f"Email already registered: {email}")
+            logger.warning("Email already registered: %s", email)
             return jsonify({"error": "Email is already registered."}), 400
         if db.query(Customer).filter_by(phoneNumber=phoneNumber).first():
-            logger.warning(f"Phone number already registered: {phoneNumber}")
+            logger.warning("Phone number already registered: %s", phoneNumber)
             return jsonify({"error": "Phone number is already registered."}), 400
 
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        hashed_password = hash_pool.generate_password_hash(password)
         new_customer = Customer(
             firstName=firstName,
             lastName=lastName,
@@ -649,18 +2431,18 @@ def signup():
         )
         db.add(new_customer)
         db.commit()
-        logger.info(f"New customer added: {new_customer}")
+        logger.info("New customer added with ID: %s", new_customer.id)
         return jsonify({'status': 201, 'message': 'Customer created successfully'}), 201
 
 
-@app.route('/login', methods=['POST'])
+@bp.route('/login', methods=['POST'])
 @cross_origin()
 def login():
-    db = get_db_session()
+    db = get_db_session(readonly=True)
     logger.info("Login endpoint accessed")
     try:
         data = request.get_json()
-        logger.debug(f"Login data received: {data}")
+        logger.debug("Login data received for username: %s", data.get("username") if data else None)
         if not data:
             logger.warning("No data provided in login request")
             return jsonify({"error": "No data provided"}), 400
@@ -672,104 +2454,209 @@ def login():
             logger.warning("Username or password missing in login request")
             return jsonify({"error": "Username or password missing"}), 400
 
+        # read before the customer row, so a change racing the login can only make the token look stale
+        identity_version = identity_cache.stored_version(db)
         customer = db.query(Customer).filter_by(username=Nusername).first()
-        if not customer or not bcrypt.check_password_hash(customer.password, Npassword):
-            logger.warning(f"Invalid login attempt for username: {Nusername}")
+        if not customer or not hash_pool.check_password_hash(customer.password, Npassword):
+            logger.warning("Invalid login attempt for username: %s", Nusername)
             return jsonify({"error": "Invalid username or password"}), 401
 
-        access_token = create_access_token(identity=customer.username)
-        logger.info(f"Login successful for username: {Nusername}")
+        access_token = create_access_token(identity=customer.username,
+                                           additional_claims=identity_cache.claims(customer, identity_version))
+        logger.info("Login successful for username: %s", Nusername)
         return jsonify({
             "access_token": access_token,
             "role": customer.role,
             "message": "Login successful"
         }), 200
+    except HashPoolSaturated:
+        raise
     except Exception as e:
-        logger.error(f"Error during login: {e}")
+        logger.error("Error during login: %s", e)
         return jsonify({"error": "An internal error occurred"}), 500
 
 
-@app.route('/manager', methods=['GET'])
+@bp.route('/manager', methods=['GET'])
 @jwt_required()
 def manager_dashboard():
-    db = get_db_session()
+    db = get_db_session(readonly=True)
     username = get_jwt_identity()
-    logger.info(f"Manager dashboard accessed by username: {username}")
+    logger.info("Manager dashboard accessed by username: %s", username)
 
-    customer = db.query(Customer).filter_by(username=username).first()
-    if not customer or customer.role != 'manager':
-        logger.warning(f"Access denied for username: {username}")
+    identity = current_identity(db)
+    if not identity or identity["role"] != 'manager':
+        logger.warning("Access denied for username: %s", username)
         return jsonify({"error": "Access denied"}), 403
 
-    logger.info(f"Manager dashboard access granted for username: {username}")
+    logger.info("Manager dashboard access granted for username: %s", username)
     return jsonify({"message": "Welcome to the Manager Dashboard"}), 200
 
 
-@app.route('/user', methods=['GET'])
+@bp.route('/user', methods=['GET'])
 @jwt_required()
 def user_dashboard():
-    db = get_db_session()
+    db = get_db_session(readonly=True)
     username = get_jwt_identity()
-    logger.info(f"User dashboard accessed by username: {username}")
+    logger.info("User dashboard accessed by username: %s", username)
 
-    customer = db.query(Customer).filter_by(username=username).first()
-    if not customer or customer.role != 'user':
-        logger.warning(f"Access denied for username: {username}")
+    identity = current_identity(db)
+    if not identity or identity["role"] != 'user':
+        logger.warning("Access denied for username: %s", username)
         return jsonify({"error": "Access denied"}), 403
 
-    logger.info(f"User dashboard access granted for username: {username}")
+    logger.info("User dashboard access granted for username: %s", username)
     return jsonify({"message": "Welcome to the User Dashboard"}), 200
 
 
-@app.route("/findCustomersBooks", methods=["GET"])
+@bp.route("/findCustomersBooks", methods=["GET"])
 @jwt_required()
 def findCustomersBooks():
-    db = get_db_session()
+    db = get_db_session(readonly=True)
     try:
-        username = get_jwt_identity()
-        logger.info(f"findCustomersBooks accessed by username: {username}")
-
-        customer = db.query(Customer).filter_by(username=username).first()
-        if not customer:
-            logger.warning(f"User not found: {username}")
-            return jsonify({"error": "User not found"}), 404
-
-        loans = db.query(Loan).filter(Loan.custId == customer.id).all()
-        loaned_books = []
-        for loan in loans:
-            book = db.query(Book).filter_by(id=loan.bookId).first()
-            if not book:
-                logger.warning(f"Book not found for loan ID: {loan.id}")
-                continue
-            loaned_books.append({
-                "book_name": book.name,
-                "author": book.author,
-                "publish_year": book.publishYear,
-                "isLate": loan.isLate
-            })
-
-        logger.info(f"Loaned books retrieved for username: {username}")
-        return jsonify(loaned_books)
+        return customer_books_page(db)
     except Exception as e:
-        logger.error(f"Error in findCustomersBooks: {e}")
+        logger.error("Error in findCustomersBooks: %s", e)
         return jsonify({"error": "An error occurred"}), 500
 
 
-@app.route("/guestWatchList", methods=["GET"])
+@bp.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(request_metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@bp.route("/hashingStats", methods=["GET"])
+def hashingStats_endpoint():
+    return jsonify(hash_pool.stats())
+
+
+@bp.route("/guestWatchList", methods=["GET"])
+@response_cache.cached("catalog")
 def guestWatchList_endpoint():
-    logger.info("Guest watch list accessed")
-    db = get_db_session()
+    db = get_db_session(readonly=True)
     if request.method == 'GET':
-        books = db.query(Book).filter(Book.active == True).all()
-        return jsonify([{
-            "name": Book.name,
-            "author": Book.author,
-            "publishYear": Book.publishYear,
-            "isLoaned": Book.isLoaned
-        }
-        for Book in books])
+        return guest_watch_list_page(db)
+
+EXPLAIN_ROUTES = [
+    "/books?limit=100",
+    "/customers?limit=100",
+    "/loans?limit=100",
+    "/lateLoans",
+    "/guestWatchList?limit=100",
+    "/findBook?name=harry",
+    "/findBook?publishYear=2005",
+    "/findCustomer?lastName=levi",
+    "/findCustomersBooks?active=1&limit=100",
+    "/reports/circulation",
+    "/reports/books?limit=20",
+    "/reports/customers?order=late_returns&limit=20",
+]
+
+def is_full_scan(detail, statement, plan):
+    if not detail.startswith("SCAN") or "USING" in detail or "VIRTUAL TABLE" in detail:
+        return False
+    # only an unfiltered, unsorted walk stops once a LIMIT is met: with a WHERE it reads every
+    # row that fails the filter first, which is the whole table when matches are sparse
+    bounded = (re.search(r"\bLIMIT\b", statement, re.IGNORECASE) and not re.search(r"\bWHERE\b", statement, re.IGNORECASE)
+               and not any("TEMP B-TREE" in step for step in plan))
+    return not bounded
+
+def explain_routes(routes=EXPLAIN_ROUTES):
+    # replays each route and yields (route, [(plan step, is_full_scan), ...]) for every SELECT it issues
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    # replay as an existing manager holding a current token, the way a logged-in client would
+    with current_db().engine.connect() as conn:
+        identity_version = conn.execute(select(Counter.value).where(Counter.name == "identity_version")).scalar()
+        manager = conn.execute(select(Customer.username, Customer.id, Customer.role).where(
+            Customer.role == "manager", Customer.active == True).limit(1)).first()
+    if manager:
+        token = create_access_token(identity=manager.username, additional_claims=identity_cache.claims(manager, identity_version))
+    else:
+        token = create_access_token(identity="explain")
+    client = current_app.test_client()
+    read_engine = current_db().read_engine
+    # plans are read on a fresh connection: preparing an EXPLAIN never reloads the schema, so a
+    # pooled one can describe indexes dropped or added since (a :memory: database has only one)
+    explain_engine = read_engine if is_memory_url(read_engine.url) else create_engine(read_engine.url, poolclass=NullPool)
+    event.listen(read_engine, "before_cursor_execute", capture)
+    try:
+        for route in routes:
+            statements.clear()
+            client.get(route, headers={"Authorization": f"Bearer {token}"})
+            steps = []
+            with explain_engine.connect() as conn:
+                for statement, parameters in statements:
+                    plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+                    steps.extend((detail, is_full_scan(detail, statement, plan)) for detail in plan)
+            yield route, steps
+    finally:
+        event.remove(read_engine, "before_cursor_execute", capture)
+        if explain_engine is not read_engine:
+            explain_engine.dispose()
+
+@bp.cli.command("explain-queries")
+def explain_queries_command():
+    # prints EXPLAIN QUERY PLAN for every SELECT the read endpoints issue
+    full_scans = 0
+    for route, steps in explain_routes():
+        print(route)
+        for detail, is_scan in steps:
+            full_scans += is_scan
+            print(f"    {'!! ' if is_scan else ''}{detail}")
+    print(f"{full_scans} full table scan(s)")
+    if full_scans:
+        raise SystemExit(1)
+
+def after_fork_in_child():
+    # gunicorn --preload forks after create_app(): restart the log listener thread and
+    # drop connections and bcrypt threads inherited from the parent
+    if log_pipeline is not None:
+        log_pipeline[1].start()
+    hash_pool.after_fork()
+    for database in list(open_databases):
+        database.after_fork()
+
+os.register_at_fork(after_in_child=after_fork_in_child)
+
+def create_app(config=None):
+    # the report models have to be on Base before the schema is migrated or checked
+    import reports
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    app.config.update(config or {})
+    configure_logging(app)
+    CORS(app, expose_headers=["X-Next-Cursor", "X-Sync-Version"])
+    app.json = json_provider_class(app.config["JSON_SERIALIZER"])(app)
+    jwt.init_app(app)
+    bcrypt.init_app(app)
+    hash_pool.init_app(app)
+    identity_cache.init_app(app)
+    response_cache.init_app(app)
+    event_bus.init_app(app)
+    request_metrics.init_app(app)
+
+    database = Database(app.config["DATABASE_URL"])
+    app.extensions["db"] = database
+    app.teardown_appcontext(remove_db_sessions)
+    if app.config["AUTO_MIGRATE"]:
+        migrate_schema(database.engine)
+    database.search_enabled = search_index_available(database.engine)
+    check_schema(database.engine)
+
+    app.register_blueprint(bp)
+    app.register_blueprint(reports.bp)
+    return app
 
 if __name__ == "__main__":
+    # reports imports this module as "app"; share it rather than loading a second copy
+    sys.modules.setdefault("app", sys.modules[__name__])
+    # the development server migrates on start so a fresh checkout runs as-is
+    app = create_app({"AUTO_MIGRATE": True})
+    start_maintenance_jobs(app)
     app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
 
 
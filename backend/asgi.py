@@ -0,0 +1,208 @@
+import asyncio
+import io
+import sys
+from contextlib import asynccontextmanager
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import current_app, jsonify, request
+from flask_jwt_extended import verify_jwt_in_request
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app import (apply_sqlite_pragmas, books_page, create_app, customer_books_page, find_books_page,
+                 guest_watch_list_page, is_memory_url, late_loans_page, loans_page, logger, response_cache,
+                 start_maintenance_jobs, start_query_timer, stop_query_timer, wants_changes, wants_stream)
+
+# Async serving mode: `uvicorn --factory asgi:create_asgi_app`. The plain GET pages of the read
+# endpoints run as coroutines over AsyncSession/aiosqlite, so a request waiting on SQLite holds
+# no thread; everything else (writes, ?since=, ?stream=1, /events, login) is handed to the
+# Flask app on a worker thread and behaves exactly as under a WSGI server.
+
+ASYNC_VIEWS = {}
+
+def async_view(path):
+    def decorator(view):
+        ASYNC_VIEWS[path] = view
+        return view
+    return decorator
+
+def create_async_read_engine(url, pool_size):
+    if is_memory_url(url):
+        # aiosqlite opens its own connections and each would see a different empty database
+        raise ValueError("the async serving mode needs a file database, not an in-memory one")
+    # aiosqlite defaults to NullPool; keep connections (and their worker threads and pragmas)
+    # pooled. Every connection is a thread contending for the GIL with the event loop, so the
+    # pool stays small and waiting requests queue on it without holding anything.
+    engine = create_async_engine(make_url(url).set(drivername="sqlite+aiosqlite"), echo=False,
+                                 poolclass=AsyncAdaptedQueuePool, pool_size=pool_size, max_overflow=0, pool_timeout=30)
+    apply_sqlite_pragmas(engine.sync_engine, readonly=True)
+    event.listen(engine.sync_engine, "before_cursor_execute", start_query_timer)
+    event.listen(engine.sync_engine, "after_cursor_execute", stop_query_timer)
+    return engine
+
+class AsyncDbBusy(Exception):
+    pass
+
+
+class AsyncSessions:
+    # app.extensions["async_db"]: `async with sessions() as db` yields an AsyncSession once a
+    # connection is free. Requests take one in arrival order: the pool's own queue is not fair,
+    # and under load it left some requests waiting several times longer than the median. A
+    # request still waiting after ASYNC_DB_WAIT_TIMEOUT is shed with AsyncDbBusy (a 503).
+    def __init__(self, engine, pool_size):
+        self.sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+        self.slots = asyncio.Semaphore(pool_size)
+
+    @asynccontextmanager
+    async def __call__(self):
+        try:
+            await asyncio.wait_for(self.slots.acquire(), current_app.config["ASYNC_DB_WAIT_TIMEOUT"])
+        except asyncio.TimeoutError:
+            raise AsyncDbBusy()
+        try:
+            async with self.sessionmaker() as db:
+                yield db
+        finally:
+            self.slots.release()
+
+def async_db_busy(e):
+    logger.warning("No async database connection free for %s, shedding request", request.path)
+    response = jsonify({"error": "Server is busy, please retry shortly."})
+    response.headers["Retry-After"] = str(current_app.config["ASYNC_DB_RETRY_AFTER"])
+    return response, 503
+
+async def run_page(page):
+    # the page functions are the same ones the sync views call; run_sync drives them on the
+    # async connection, yielding to the event loop whenever a statement is in flight
+    try:
+        async with current_app.extensions["async_db"]() as db:
+            return await db.run_sync(page)
+    except AsyncDbBusy:
+        raise
+    except Exception as e:
+        logger.error("Error in %s endpoint: %s", request.path, e)
+        return jsonify({"error": "An error occurred"}), 500
+
+@async_view("/books")
+@response_cache.cached("catalog")
+async def books_endpoint():
+    return await run_page(books_page)
+
+@async_view("/loans")
+async def loans_endpoint():
+    return await run_page(loans_page)
+
+@async_view("/lateLoans")
+async def lateLoans_endpoint():
+    return await run_page(late_loans_page)
+
+@async_view("/findBook")
+async def findBook():
+    return await run_page(find_books_page)
+
+@async_view("/findCustomersBooks")
+async def findCustomersBooks():
+    # jwt_required() would run a coroutine view on a fresh event loop, so verify inline
+    verify_jwt_in_request()
+    return await run_page(customer_books_page)
+
+@async_view("/guestWatchList")
+@response_cache.cached("catalog")
+async def guestWatchList_endpoint():
+    return await run_page(guest_watch_list_page)
+
+def scope_environ(scope):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        value = value.decode("latin1")
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+class AsyncReadApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.engine = create_async_read_engine(flask_app.config["DATABASE_URL"], flask_app.config["ASYNC_DB_POOL_SIZE"])
+        flask_app.extensions["async_db"] = AsyncSessions(self.engine, flask_app.config["ASYNC_DB_POOL_SIZE"])
+        flask_app.register_error_handler(AsyncDbBusy, async_db_busy)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        view = None
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD"):
+            view = ASYNC_VIEWS.get(scope["path"])
+        response = await self.dispatch(view, scope_environ(scope)) if view else None
+        if response is None:
+            return await self.wsgi(scope, receive, send)
+        await send({
+            "type": "http.response.start",
+            "status": response.status_code,
+            "headers": [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in response.headers.items()],
+        })
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else response.get_data()})
+
+    async def dispatch(self, view, environ):
+        # the same request lifecycle as Flask.full_dispatch_request, so before/after hooks
+        # (metrics, CORS headers) and the JWT error handlers apply to the async views too
+        flask_app = self.flask_app
+        with flask_app.request_context(environ):
+            if wants_stream() or wants_changes():
+                return None
+            try:
+                try:
+                    rv = flask_app.preprocess_request()
+                    if rv is None:
+                        rv = await view()
+                except Exception as e:
+                    rv = flask_app.handle_user_exception(e)
+                return flask_app.finalize_request(rv)
+            except Exception as e:
+                return flask_app.handle_exception(e)
+
+    async def aclose(self):
+        # aiosqlite connections each own a non-daemon thread, so the process cannot exit before this
+        await self.engine.dispose()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+def create_asgi_app(config=None):
+    return AsyncReadApp(create_app(config))
+
+if __name__ == "__main__":
+    import uvicorn
+
+    asgi_app = create_asgi_app({"AUTO_MIGRATE": True})
+    start_maintenance_jobs(asgi_app.flask_app)
+    uvicorn.run(asgi_app, host="0.0.0.0", port=5000)
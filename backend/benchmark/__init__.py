@@ -0,0 +1,10 @@
+"""Synthetic library datasets and a latency/query-count benchmark for the Flask routes.
+
+Run from the backend directory:
+
+    python -m benchmark generate --size 100k --db bench.db
+    python -m benchmark run --db bench.db --output baseline.json
+    python -m benchmark run --db bench.db --baseline baseline.json
+    python -m benchmark logging --db bench.db
+    python -m benchmark checkout --db bench.db --threads 16
+"""
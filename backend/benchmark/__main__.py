@@ -0,0 +1,70 @@
+import argparse
+
+from benchmark import checkout_contention, dataset, logging_overhead, runner, serving
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmark")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="create a seeded synthetic library database")
+    generate.add_argument("--db", default="bench.db")
+    generate.add_argument("--size", choices=sorted(dataset.SIZES), default="10k")
+    generate.add_argument("--seed", type=int, default=1234)
+
+    run = commands.add_parser("run", help="drive every route through the Flask test client")
+    run.add_argument("--db", default="bench.db")
+    run.add_argument("--iterations", type=int, default=50)
+    run.add_argument("--warm-cache", action="store_true", help="let the response cache serve repeated reads")
+    run.add_argument("--output", help="write the results as JSON, e.g. a new baseline")
+    run.add_argument("--baseline", help="JSON file from a previous run to diff against")
+
+    logs = commands.add_parser("logging", help="compare per-request logging cost of the old and current setup")
+    logs.add_argument("--db", default="bench.db")
+    logs.add_argument("--requests", type=int, default=20000)
+
+    contention = commands.add_parser("checkout", help="hammer one book with concurrent checkouts")
+    contention.add_argument("--db", default="bench.db")
+    contention.add_argument("--threads", type=int, default=16)
+    contention.add_argument("--rounds", type=int, default=20)
+
+    asgi = commands.add_parser("serving", help="compare the read routes under the WSGI app and the async ASGI mode")
+    asgi.add_argument("--db", default="bench.db")
+    asgi.add_argument("--concurrency", type=int, default=200)
+    asgi.add_argument("--requests", type=int, default=2000)
+    asgi.add_argument("--threads", type=int, default=8, help="request threads of the WSGI side")
+    asgi.add_argument("--warm-cache", action="store_true", help="let the response cache serve repeated reads")
+    asgi.add_argument("--guest-pages", action="store_true", help="only drive the cached guest pages")
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        counts = dataset.generate(args.db, args.size, args.seed)
+        print(f"Generated {args.db}: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
+        return
+
+    if args.command == "logging":
+        logging_overhead.print_report(logging_overhead.run(args.db, args.requests), args.requests)
+        return
+
+    if args.command == "serving":
+        routes = serving.GUEST_ROUTES if args.guest_pages else serving.ROUTES
+        results = serving.run(args.db, args.concurrency, args.requests, args.threads, args.warm_cache, routes)
+        serving.print_report(results, args.concurrency, args.requests, args.threads, routes)
+        return
+
+    if args.command == "checkout":
+        result = checkout_contention.run(args.db, args.threads, args.rounds)
+        checkout_contention.print_report(result)
+        if result["rounds_without_exactly_one_loan"]:
+            raise SystemExit(1)
+        return
+
+    result = runner.run(args.db, args.iterations, args.warm_cache)
+    diff = runner.compare(result, runner.load_baseline(args.baseline)) if args.baseline else None
+    runner.print_report(result, diff)
+    if args.output:
+        runner.save(result, args.output)
+
+
+if __name__ == "__main__":
+    main()
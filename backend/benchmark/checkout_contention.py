@@ -0,0 +1,51 @@
+import threading
+from collections import Counter
+
+
+def run(path, threads=16, rounds=20):
+    # every round, all threads try to check out the same book at once; exactly one may win
+    import app
+
+    flask_app = app.create_app({"DATABASE_URL": f"sqlite:///{path}"})
+    flask_app.app_context().push()
+    database = flask_app.extensions["db"]
+    db = app.get_db_session()
+    book = db.query(app.Book).filter(app.Book.active == True, app.Book.isLoaned == False).first()
+    customer = db.query(app.Customer).filter(app.Customer.active == True).first()
+    book_id, cust_id = book.id, customer.id
+    database.remove_sessions()
+
+    statuses = Counter()
+    violations = 0
+    lock = threading.Lock()
+    for _ in range(rounds):
+        barrier = threading.Barrier(threads)
+
+        def checkout():
+            client = flask_app.test_client()
+            barrier.wait()
+            response = client.put("/books", json={"id": book_id, "custId": cust_id})
+            with lock:
+                statuses[response.status_code] += 1
+
+        workers = [threading.Thread(target=checkout) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        db = app.get_db_session()
+        active = db.query(app.Loan).filter(app.Loan.bookId == book_id, app.Loan.active == True).count()
+        violations += active != 1
+        response = flask_app.test_client().post("/loans/return", json={"custId": cust_id, "bookIds": [book_id]})
+        assert response.status_code == 200, response.get_json()
+        database.remove_sessions()
+
+    return {"book": book_id, "threads": threads, "rounds": rounds,
+            "statuses": dict(statuses), "rounds_without_exactly_one_loan": violations}
+
+
+def print_report(result):
+    print(f"book {result['book']}: {result['rounds']} rounds x {result['threads']} concurrent checkouts")
+    print("responses: " + ", ".join(f"{status}={count}" for status, count in sorted(result["statuses"].items())))
+    print(f"rounds without exactly one active loan: {result['rounds_without_exactly_one_loan']}")
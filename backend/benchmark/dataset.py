@@ -0,0 +1,119 @@
+import os
+import random
+import sqlite3
+from datetime import date, timedelta
+
+SIZES = {
+    "10k": 10_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+}
+
+FIRST_NAMES = ["Maya", "Rotem", "Orel", "Joseph", "Noa", "Daniel", "Yael", "Amit", "Tamar", "Eitan", "Shira", "Omer"]
+LAST_NAMES = ["Levi", "Cohen", "Mizrahi", "Peretz", "Biton", "Dahan", "Avraham", "Friedman", "Katz", "Judom"]
+CITIES = ["Tel Aviv", "Haifa", "Jerusalem", "Eilat", "Ohio", "Los Angeles", "Beer Sheva", "Netanya"]
+WORDS = ["Shadow", "River", "Winter", "Garden", "Silent", "Empire", "Storm", "Glass", "Hidden", "Last",
+         "Ocean", "Stone", "Golden", "Night", "Forest", "Crown", "Echo", "Paper", "Iron", "Summer"]
+LOAN_DAYS = {1: 10, 2: 5, 3: 2}
+
+# one precomputed bcrypt hash ("Bench123!") shared by every synthetic customer
+PASSWORD_HASH = "$2b$04$JEqmJ2WtVqJmPfJpobhBP.B4njVKdNpU33.EHaSZriKFsjsIuyuHO"
+BATCH_SIZE = 10_000
+
+
+def _batched(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def book_rows(rng, count):
+    for book_id in range(1, count + 1):
+        name = " ".join(rng.sample(WORDS, rng.randint(2, 4)))
+        author = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        yield (book_id, name, author, str(rng.randint(1950, 2024)), rng.randint(1, 3), False, rng.random() > 0.02)
+
+
+def customer_rows(rng, count):
+    today = date.today()
+    for customer_id in range(1, count + 1):
+        birth_date = today - timedelta(days=rng.randint(8 * 365, 80 * 365))
+        age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        role = "manager" if customer_id % 500 == 1 else "user"
+        yield (customer_id, first_name, last_name, age, birth_date.isoformat(), rng.choice(CITIES),
+               f"user{customer_id}@example.com", f"05{customer_id:08d}", role, f"user{customer_id}",
+               PASSWORD_HASH, rng.random() > 0.03)
+
+
+def loan_rows(rng, count, books, customers, loaned_books):
+    # most loans are returned history; about 15% of books are currently out and
+    # a third of those are overdue, with lateness following an exponential tail
+    today = date.today()
+    for loan_id in range(1, count + 1):
+        book_id = rng.randint(1, books)
+        loan_type = rng.randint(1, 3)
+        outstanding = book_id not in loaned_books and rng.random() < 0.15 * books / count
+        if outstanding:
+            loaned_books.add(book_id)
+            overdue = rng.random() < 0.33
+            if overdue:
+                days_out = LOAN_DAYS[loan_type] + int(rng.expovariate(1 / 12)) + 1
+            else:
+                days_out = rng.randint(0, LOAN_DAYS[loan_type])
+            loan_date = today - timedelta(days=days_out)
+            expected = loan_date + timedelta(days=LOAN_DAYS[loan_type])
+            yield (rng.randint(1, customers), book_id, loan_id, loan_date.isoformat(), expected.isoformat(), None, 0, False, True)
+            continue
+        loan_date = today - timedelta(days=rng.randint(30, 730))
+        expected = loan_date + timedelta(days=LOAN_DAYS[loan_type])
+        late_days = int(rng.expovariate(1 / 6)) if rng.random() < 0.2 else 0
+        if late_days:
+            returned = expected + timedelta(days=late_days)
+        else:
+            returned = loan_date + timedelta(days=rng.randint(0, LOAN_DAYS[loan_type]))
+        yield (rng.randint(1, customers), book_id, loan_id, loan_date.isoformat(), expected.isoformat(), returned.isoformat(),
+               late_days, late_days > 0, False)
+
+
+def generate(path, size="10k", seed=1234):
+    books = SIZES[size]
+    customers = max(books // 10, 10)
+    loans = books * 2
+    rng = random.Random(seed)
+
+    if os.path.exists(path):
+        os.remove(path)
+    # migrating the new file creates the schema, indexes, search index and triggers
+    import app
+    flask_app = app.create_app({"DATABASE_URL": f"sqlite:///{path}", "AUTO_MIGRATE": True})
+    flask_app.extensions["db"].engine.dispose()
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous=OFF")
+    with conn:
+        conn.executemany('INSERT INTO "loanTypes" ("loanType", num_of_days) VALUES (?, ?)', LOAN_DAYS.items())
+        for batch in _batched(book_rows(rng, books)):
+            conn.executemany('INSERT INTO books (id, name, author, "publishYear", "bookLoanType", "isLoaned", active) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?)', batch)
+        for batch in _batched(customer_rows(rng, customers)):
+            conn.executemany('INSERT INTO customers (id, "firstName", "lastName", age, "birthDate", city, email, '
+                             '"phoneNumber", role, username, password, active) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             batch)
+        loaned_books = set()
+        for batch in _batched(loan_rows(rng, loans, books, customers, loaned_books)):
+            conn.executemany('INSERT INTO loans ("custId", "bookId", id, "loanDate", "expected_returnDate", "returnDate", '
+                             '"lateDays_num", "isLate", active) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', batch)
+        for batch in _batched((book_id,) for book_id in loaned_books):
+            conn.executemany('UPDATE books SET "isLoaned" = 1 WHERE id = ?', batch)
+    conn.execute("ANALYZE")
+    conn.close()
+    with flask_app.app_context():
+        app.sweep_overdue_loans()
+    return {"books": books, "customers": customers, "loans": loans, "outstanding": len(loaned_books)}
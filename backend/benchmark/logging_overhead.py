@@ -0,0 +1,69 @@
+import logging
+import os
+import tempfile
+import time
+
+# roughly what one request logs today: an access line, a high-volume info line and a lookup line
+REQUEST_LINES = 3
+
+
+def _legacy_logger(path):
+    # the previous setup: basicConfig-style FileHandler, f-strings formatted on the request thread
+    logger = logging.getLogger("benchmark.legacy")
+    logger.propagate = False
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return logger, handler
+
+
+def _legacy_request(logger, i):
+    username = f"user{i}"
+    logger.info(f"findCustomersBooks accessed by username: {username}")
+    logger.info("Fetched all active loans")
+    logger.info(f"Loaned books retrieved for username: {username}")
+
+
+def _pipeline_request(logger, i):
+    username = f"user{i}"
+    logger.info("findCustomersBooks accessed by username: %s", username)
+    logger.info("Fetched all active loans")
+    logger.info("Loaned books retrieved for username: %s", username)
+
+
+def run(path, requests=20000):
+    import app
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        logger, handler = _legacy_logger(os.path.join(tmp, "legacy.log"))
+        start = time.perf_counter()
+        for i in range(requests):
+            _legacy_request(logger, i)
+        elapsed = time.perf_counter() - start
+        handler.close()
+        results["legacy"] = {"request_path_us": round(elapsed / requests * 1e6, 2),
+                             "drain_ms": 0.0}
+
+        queue_handler, listener = app.build_log_pipeline(os.path.join(tmp, "pipeline.log"))
+        logger = logging.getLogger("benchmark.pipeline")
+        logger.propagate = False
+        logger.addHandler(queue_handler)
+        logger.setLevel(logging.INFO)
+        listener.start()
+        start = time.perf_counter()
+        for i in range(requests):
+            _pipeline_request(logger, i)
+        elapsed = time.perf_counter() - start
+        drain_start = time.perf_counter()
+        listener.stop()
+        results["pipeline"] = {"request_path_us": round(elapsed / requests * 1e6, 2),
+                               "drain_ms": round((time.perf_counter() - drain_start) * 1000, 1)}
+    return results
+
+
+def print_report(results, requests):
+    print(f"{requests} simulated requests, {REQUEST_LINES} log calls each")
+    for name, r in results.items():
+        print(f"{name:<10} {r['request_path_us']:>8} us/request on the request thread   background drain {r['drain_ms']} ms")
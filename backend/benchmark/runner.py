@@ -0,0 +1,140 @@
+import json
+import os
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+ROUTES = [
+    ("GET", "/books?limit=100", None),
+    ("GET", "/books", None),
+    ("GET", "/customers?limit=100", None),
+    ("GET", "/loans?limit=100", None),
+    ("GET", "/lateLoans", None),
+    ("GET", "/guestWatchList?limit=100", None),
+    ("GET", "/findBook?name=shadow%20riv", None),
+    ("GET", "/findBook?name=adow&mode=substring", None),
+    ("GET", "/findCustomer?lastName=levi&city=haifa", None),
+    ("GET", "/findCustomersBooks", "user"),
+    ("GET", "/manager", "manager"),
+    ("GET", "/reports/books?limit=100", "manager"),
+]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(path, iterations=50, warm_cache=False):
+    import app
+    from sqlalchemy import event
+
+    flask_app = app.create_app({"DATABASE_URL": f"sqlite:///{path}"})
+    flask_app.app_context().push()
+    client = flask_app.test_client()
+    queries = [0]
+
+    def count_query(*args):
+        queries[0] += 1
+
+    database = flask_app.extensions["db"]
+    for engine in {database.engine, database.read_engine}:
+        event.listen(engine, "before_cursor_execute", count_query)
+
+    db = app.get_db_session()
+    tokens = {}
+    for role in ("user", "manager"):
+        customer = db.query(app.Customer).filter_by(role=role, active=True).first()
+        tokens[role] = app.create_access_token(identity=customer.username,
+                                               additional_claims={"role": customer.role, "custId": customer.id})
+    database.remove_sessions()
+
+    results = {}
+    for method, route, role in ROUTES:
+        headers = {"Authorization": f"Bearer {tokens[role]}"} if role else {}
+
+        def call():
+            if not warm_cache:
+                app.response_cache.invalidate("catalog")
+            response = client.open(route, method=method, headers=headers)
+            response.get_data()
+            return response
+
+        call()
+        latencies = []
+        queries[0] = 0
+        for _ in range(iterations):
+            start = time.perf_counter()
+            response = call()
+            latencies.append((time.perf_counter() - start) * 1000)
+        queries_per_request = queries[0] / iterations
+
+        tracemalloc.start()
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[f"{method} {route}"] = {
+            "status": response.status_code,
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(statistics.mean(latencies), 3),
+            "queries_per_request": round(queries_per_request, 2),
+            "peak_kib": round(peak / 1024, 1),
+            "bytes": len(response.get_data()),
+        }
+
+    return {
+        "meta": {
+            "database": os.path.basename(path),
+            "iterations": iterations,
+            "warm_cache": warm_cache,
+            "revision": git_revision(),
+            "created": datetime.now().isoformat(timespec="seconds"),
+        },
+        "routes": results,
+    }
+
+
+def compare(current, baseline):
+    # relative change per metric against a previous run, positive means slower/bigger
+    diff = {}
+    for route, metrics in current["routes"].items():
+        previous = baseline.get("routes", {}).get(route)
+        if not previous:
+            continue
+        diff[route] = {}
+        for name in ("p50_ms", "p95_ms", "p99_ms", "queries_per_request", "peak_kib"):
+            if previous.get(name):
+                diff[route][name] = round((metrics[name] - previous[name]) / previous[name] * 100, 1)
+    return diff
+
+
+def print_report(result, diff=None):
+    print(f"{'route':<45} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>8} {'peak KiB':>10}")
+    for route, m in result["routes"].items():
+        line = f"{route:<45} {m['p50_ms']:>9} {m['p95_ms']:>9} {m['p99_ms']:>9} {m['queries_per_request']:>8} {m['peak_kib']:>10}"
+        if diff and route in diff:
+            line += "  " + " ".join(f"{k}:{v:+}%" for k, v in diff[route].items())
+        print(line)
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(result, path):
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
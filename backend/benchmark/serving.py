@@ -0,0 +1,123 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark.runner import percentile
+
+# the read endpoints the async mode serves natively, with the role whose token they need
+ROUTES = [
+    ("/guestWatchList?limit=100", None),
+    ("/books?limit=100", None),
+    ("/findBook?name=shadow%20riv", None),
+    ("/loans?limit=100", None),
+    ("/lateLoans", None),
+    ("/findCustomersBooks", "user"),
+]
+# the catalog pages a guest browses, both behind the response cache
+GUEST_ROUTES = [route for route in ROUTES if route[0].split("?")[0] in ("/guestWatchList", "/books")]
+
+
+def _scope(route, headers):
+    path, _, query = route.partition("?")
+    return {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": path, "root_path": "", "query_string": query.encode(), "server": ("benchmark", 80),
+            "client": ("127.0.0.1", 0), "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()]}
+
+
+async def _drive(call, concurrency, requests):
+    # closed loop: every client sends its next request as soon as the previous one is answered,
+    # so latency includes any time spent waiting for a free worker
+    latencies, errors = [], [0]
+    peak_threads = [threading.active_count()]
+    issued = iter(range(requests))
+
+    async def client():
+        for i in issued:
+            start = time.perf_counter()
+            status = await call(i)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                errors[0] += 1
+            peak_threads[0] = max(peak_threads[0], threading.active_count())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests_per_s": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "errors": errors[0],
+        "peak_threads": peak_threads[0],
+    }
+
+
+def run(path, concurrency=200, requests=2000, threads=8, warm_cache=False, routes=ROUTES):
+    import app
+    import asgi
+
+    asgi_app = asgi.create_asgi_app({"DATABASE_URL": f"sqlite:///{path}"})
+    flask_app = asgi_app.flask_app
+    with flask_app.app_context():
+        db = app.get_db_session()
+        customer = db.query(app.Customer).filter_by(role="user", active=True).first()
+        token = app.create_access_token(identity=customer.username,
+                                        additional_claims={"role": customer.role, "custId": customer.id})
+    requests_by_index = [(route, {"Authorization": f"Bearer {token}"} if role else {}) for route, role in routes]
+
+    def invalidate():
+        if not warm_cache:
+            with flask_app.app_context():
+                app.response_cache.invalidate("catalog")
+
+    # WSGI: a fixed pool of request threads, what one gunicorn worker with --threads gives
+    clients = threading.local()
+
+    def call_wsgi(i):
+        if not hasattr(clients, "client"):
+            clients.client = flask_app.test_client()
+        route, headers = requests_by_index[i % len(requests_by_index)]
+        invalidate()
+        response = clients.client.get(route, headers=headers)
+        response.get_data()
+        return response.status_code
+
+    async def wsgi(i):
+        return await asyncio.get_running_loop().run_in_executor(pool, call_wsgi, i)
+
+    async def asgi_call(i):
+        route, headers = requests_by_index[i % len(requests_by_index)]
+        invalidate()
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        await asgi_app(_scope(route, headers), receive, send)
+        return messages[0]["status"]
+
+    async def measure():
+        results = {}
+        for call in (wsgi, asgi_call):
+            await _drive(call, len(routes), len(routes))
+        results["wsgi"] = await _drive(wsgi, concurrency, requests)
+        results["asgi"] = await _drive(asgi_call, concurrency, requests)
+        await asgi_app.aclose()
+        return results
+
+    with ThreadPoolExecutor(threads) as pool:
+        return asyncio.run(measure())
+
+
+def print_report(results, concurrency, requests, threads, routes=ROUTES):
+    print(f"{concurrency} concurrent clients, {requests} requests over {len(routes)} read routes, "
+          f"WSGI with {threads} request threads")
+    print(f"{'mode':<6} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'errors':>7} {'threads':>8}")
+    for mode, r in results.items():
+        print(f"{mode:<6} {r['requests_per_s']:>9} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} "
+              f"{r['errors']:>7} {r['peak_threads']:>8}")
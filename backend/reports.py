@@ -0,0 +1,236 @@
+from datetime import date, timedelta
+
+import click
+from flask import Blueprint, jsonify, request
+from sqlalchemy import Column, Date, ForeignKey, Index, Integer, text
+
+from app import Base, Book, Customer, current_db, encode_rows, get_db_session, logger, manager_required, page_limit
+
+# Circulation reports: per-day, per-book, per-customer and per-loan-type loan totals and a
+# days-late histogram, kept current by triggers on loans so a report never scans the loans.
+# create_app() registers the blueprint and migrate_schema() installs the triggers.
+
+bp = Blueprint("reports", __name__, cli_group=None)
+
+class LoanStatsMixin:
+    checkouts = Column(Integer, nullable=False, default=0, server_default="0")
+    returns = Column(Integer, nullable=False, default=0, server_default="0")
+    late_returns = Column(Integer, nullable=False, default=0, server_default="0")
+    late_days = Column(Integer, nullable=False, default=0, server_default="0")
+
+class DailyLoanStats(LoanStatsMixin, Base):
+    # checkouts are counted on their loanDate, returns on their returnDate
+    __tablename__ = "report_loans_daily"
+    day = Column(Date(), primary_key=True)
+
+class BookLoanStats(LoanStatsMixin, Base):
+    __tablename__ = "report_book_loans"
+    bookId = Column(Integer, ForeignKey("books.id"), primary_key=True)
+
+class CustomerLoanStats(LoanStatsMixin, Base):
+    __tablename__ = "report_customer_loans"
+    custId = Column(Integer, ForeignKey("customers.id"), primary_key=True)
+
+class LoanTypeStats(LoanStatsMixin, Base):
+    __tablename__ = "report_loan_type_loans"
+    loanType = Column(Integer, primary_key=True)
+
+class OverdueDaysHistogram(Base):
+    # returned loans by lateDays_num, bucketed by the lower bounds in OVERDUE_DAY_BUCKETS
+    __tablename__ = "report_overdue_days"
+    bucket = Column(Integer, primary_key=True)
+    returns = Column(Integer, nullable=False, default=0, server_default="0")
+
+REPORT_MODELS = (DailyLoanStats, BookLoanStats, CustomerLoanStats, LoanTypeStats, OverdueDaysHistogram)
+
+# the top-N orderings of /reports/books and /reports/customers
+Index("ix_report_book_loans_checkouts", BookLoanStats.checkouts)
+Index("ix_report_book_loans_late_returns", BookLoanStats.late_returns)
+Index("ix_report_customer_loans_checkouts", CustomerLoanStats.checkouts)
+Index("ix_report_customer_loans_late_returns", CustomerLoanStats.late_returns)
+
+# Report aggregates: table -> (key column, key of a checkout, key of a return) over a loan row.
+# Every loan insert counts a checkout and every loan leaving the active set counts a return,
+# so books PUT, loans DELETE, the batch checkout/return endpoints and any script writing
+# loans directly all feed them. Archival deletes are not counted: the history keeps
+# contributing to the totals it already made.
+REPORT_AGGREGATES = {
+    "report_loans_daily": ("day", '{row}."loanDate"', '{row}."returnDate"'),
+    "report_book_loans": ("bookId", '{row}."bookId"', '{row}."bookId"'),
+    "report_customer_loans": ("custId", '{row}."custId"', '{row}."custId"'),
+    # the book's loan type when the row is counted; a rebuild uses the type it has today
+    "report_loan_type_loans": ("loanType", '(SELECT "bookLoanType" FROM books WHERE id = {row}."bookId")',
+                               '(SELECT "bookLoanType" FROM books WHERE id = {row}."bookId")'),
+}
+OVERDUE_DAY_BUCKETS = (0, 1, 4, 8, 15, 31)
+REPORT_STATS_FIELDS = ("checkouts", "returns", "late_returns", "late_days")
+REPORT_STATS_COLUMNS = ", ".join(REPORT_STATS_FIELDS)
+
+def overdue_bucket_expression(row):
+    days = f'coalesce({row}."lateDays_num", 0)'
+    cases = " ".join(f"WHEN {days} >= {bound} THEN {bound}" for bound in reversed(OVERDUE_DAY_BUCKETS[1:]))
+    return f"CASE {cases} ELSE 0 END"
+
+def report_upserts(row, returned):
+    # one UPSERT per aggregate for a checkout, or for a return when returned is set
+    statements = []
+    for name, (key, checkout_key, return_key) in REPORT_AGGREGATES.items():
+        if returned:
+            statements.append(f"""
+                INSERT INTO {name} ("{key}", returns, late_returns, late_days)
+                VALUES ({return_key.format(row=row)}, 1, coalesce({row}."isLate", 0), coalesce({row}."lateDays_num", 0))
+                ON CONFLICT("{key}") DO UPDATE SET returns = returns + 1, late_returns = late_returns + excluded.late_returns,
+                    late_days = late_days + excluded.late_days;""")
+        else:
+            statements.append(f"""
+                INSERT INTO {name} ("{key}", checkouts) VALUES ({checkout_key.format(row=row)}, 1)
+                ON CONFLICT("{key}") DO UPDATE SET checkouts = checkouts + 1;""")
+    if returned:
+        statements.append(f"""
+            INSERT INTO report_overdue_days (bucket, returns) VALUES ({overdue_bucket_expression(row)}, 1)
+            ON CONFLICT(bucket) DO UPDATE SET returns = returns + 1;""")
+    return "".join(statements)
+
+def setup_report_aggregates(engine):
+    # the tables are created here too, for apps whose Base was built without this module
+    for model in REPORT_MODELS:
+        model.__table__.create(bind=engine, checkfirst=True)
+    with engine.begin() as conn:
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'report_loans_ai'")).first()
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS report_loans_ai AFTER INSERT ON loans BEGIN {report_upserts('new', False)} END"))
+        # loans imported as already returned history count as a checkout and a return
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS report_loans_ai_returned AFTER INSERT ON loans WHEN NOT coalesce(new.active, 1)
+            BEGIN {report_upserts('new', True)} END"""))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS report_loans_au AFTER UPDATE OF active ON loans
+            WHEN coalesce(old.active, 1) AND NOT coalesce(new.active, 1) BEGIN {report_upserts('new', True)} END"""))
+    if not exists:
+        rebuild_report_aggregates(engine)
+
+def rebuild_report_aggregates(engine, check_only=False):
+    # Recompute every aggregate from scratch: one scan of loans and loan_history into a temp
+    # table, then one GROUP BY per aggregate. Returns the number of rows that differed from the
+    # trigger-maintained tables; those are replaced unless check_only is set.
+    drift = {}
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TEMP TABLE report_source AS
+            SELECT "custId", "bookId", "loanDate", "returnDate", "isLate", "lateDays_num", active FROM loans
+            UNION ALL
+            SELECT "custId", "bookId", "loanDate", "returnDate", "isLate", "lateDays_num", 0 FROM loan_history"""))
+        rebuilt = {
+            name: f"""
+                SELECT key, sum(checkouts), sum(returns), sum(late_returns), sum(late_days) FROM (
+                    SELECT {checkout_key.format(row="report_source")} AS key, 1 AS checkouts, 0 AS returns,
+                           0 AS late_returns, 0 AS late_days FROM report_source
+                    UNION ALL
+                    SELECT {return_key.format(row="report_source")}, 0, 1, coalesce("isLate", 0),
+                           coalesce("lateDays_num", 0) FROM report_source WHERE NOT active
+                ) GROUP BY key"""
+            for name, (key, checkout_key, return_key) in REPORT_AGGREGATES.items()
+        }
+        rebuilt["report_overdue_days"] = f"""
+            SELECT {overdue_bucket_expression("report_source")} AS bucket, count(*) FROM report_source
+            WHERE NOT active GROUP BY bucket"""
+        for name, select_sql in rebuilt.items():
+            key = REPORT_AGGREGATES[name][0] if name in REPORT_AGGREGATES else "bucket"
+            columns = f'"{key}", {REPORT_STATS_COLUMNS}' if name in REPORT_AGGREGATES else "bucket, returns"
+            conn.execute(text(f"CREATE TEMP TABLE fresh_{name} AS {select_sql}"))
+            drift[name] = conn.execute(text(f"""
+                SELECT (SELECT count(*) FROM (SELECT * FROM fresh_{name} EXCEPT SELECT {columns} FROM {name}))
+                     + (SELECT count(*) FROM (SELECT {columns} FROM {name} EXCEPT SELECT * FROM fresh_{name}))""")).scalar()
+            if not check_only:
+                conn.execute(text(f"DELETE FROM {name}"))
+                conn.execute(text(f"INSERT INTO {name} ({columns}) SELECT * FROM fresh_{name}"))
+            conn.execute(text(f"DROP TABLE fresh_{name}"))
+        conn.execute(text("DROP TABLE report_source"))
+    return drift
+
+@bp.cli.command("rebuild-reports")
+@click.option("--check", is_flag=True, help="only report drift against a full recount, do not rewrite the aggregates")
+def rebuild_reports_command(check):
+    drift = rebuild_report_aggregates(current_db().engine, check_only=check)
+    for name, rows in drift.items():
+        print(f"{name}: {rows} row(s) differed")
+    if check and any(drift.values()):
+        raise SystemExit(1)
+
+# the endpoints read only the aggregates, never loans or loan_history
+REPORT_ORDERS = {"checkouts", "late_returns"}
+DEFAULT_REPORT_DAYS = 30
+
+def report_stats_columns(model):
+    return tuple(getattr(model, field) for field in REPORT_STATS_FIELDS)
+
+def top_report_page(db, model, key, entity, *columns):
+    # ?order=checkouts|late_returns&limit=N, highest first; walks the aggregate's index on the
+    # order column and looks up the named entity for each of the N rows only
+    order = request.args.get("order", "checkouts")
+    if order not in REPORT_ORDERS:
+        return jsonify({"error": f"order must be one of {', '.join(sorted(REPORT_ORDERS))}"}), 400
+    limit = page_limit(request.args.get("limit", type=int))
+    rows = (db.query(key, *columns, *report_stats_columns(model)).join(entity, entity.id == key)
+            .order_by(getattr(model, order).desc(), key.desc()).limit(limit).all())
+    return jsonify(encode_rows(rows, (key.key,) + tuple(column.key for column in columns) + REPORT_STATS_FIELDS))
+
+@bp.route("/reports/circulation", methods=["GET"])
+@manager_required
+def circulation_report():
+    # checkouts and returns per day, ?from=YYYY-MM-DD&to=YYYY-MM-DD (the last 30 days by default)
+    db = get_db_session(readonly=True)
+    try:
+        end = request.args.get("to", type=date.fromisoformat) or date.today()
+        start = request.args.get("from", type=date.fromisoformat) or end - timedelta(days=DEFAULT_REPORT_DAYS - 1)
+        rows = (db.query(DailyLoanStats.day, *report_stats_columns(DailyLoanStats))
+                .filter(DailyLoanStats.day.between(start, end)).order_by(DailyLoanStats.day).all())
+        return jsonify(encode_rows(rows, ("day",) + REPORT_STATS_FIELDS))
+    except Exception as e:
+        logger.error("Error in circulation report: %s", e)
+        return jsonify({"error": "An error occurred"}), 500
+
+@bp.route("/reports/books", methods=["GET"])
+@manager_required
+def book_report():
+    db = get_db_session(readonly=True)
+    try:
+        return top_report_page(db, BookLoanStats, BookLoanStats.bookId, Book, Book.name, Book.author)
+    except Exception as e:
+        logger.error("Error in book report: %s", e)
+        return jsonify({"error": "An error occurred"}), 500
+
+@bp.route("/reports/customers", methods=["GET"])
+@manager_required
+def customer_report():
+    db = get_db_session(readonly=True)
+    try:
+        return top_report_page(db, CustomerLoanStats, CustomerLoanStats.custId, Customer,
+                               Customer.firstName, Customer.lastName)
+    except Exception as e:
+        logger.error("Error in customer report: %s", e)
+        return jsonify({"error": "An error occurred"}), 500
+
+@bp.route("/reports/loanTypes", methods=["GET"])
+@manager_required
+def loan_type_report():
+    db = get_db_session(readonly=True)
+    try:
+        rows = db.query(LoanTypeStats.loanType, *report_stats_columns(LoanTypeStats)).order_by(LoanTypeStats.loanType).all()
+        return jsonify(encode_rows(rows, ("loanType",) + REPORT_STATS_FIELDS))
+    except Exception as e:
+        logger.error("Error in loan type report: %s", e)
+        return jsonify({"error": "An error occurred"}), 500
+
+@bp.route("/reports/overdue", methods=["GET"])
+@manager_required
+def overdue_report():
+    # returned loans by days late: one entry per bucket, toDays is null for the open-ended last one
+    db = get_db_session(readonly=True)
+    try:
+        counts = dict(db.query(OverdueDaysHistogram.bucket, OverdueDaysHistogram.returns).all())
+        bounds = OVERDUE_DAY_BUCKETS + (None,)
+        return jsonify([{"fromDays": low, "toDays": high - 1 if high is not None else None, "returns": counts.get(low, 0)}
+                        for low, high in zip(bounds, bounds[1:])])
+    except Exception as e:
+        logger.error("Error in overdue report: %s", e)
+        return jsonify({"error": "An error occurred"}), 500
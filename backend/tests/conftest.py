@@ -0,0 +1,23 @@
+import os
+import tempfile
+
+# the log pipeline is set up by the first app in the process; keep it out of the working tree
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "library-tests.log"))
+
+import pytest
+
+import app
+from benchmark import dataset
+
+
+@pytest.fixture(scope="session")
+def library_db(tmp_path_factory):
+    # the seeded 10k benchmark library, migrated and ANALYZEd like a real deployment
+    path = str(tmp_path_factory.mktemp("library") / "library.db")
+    dataset.generate(path, "10k")
+    return path
+
+
+@pytest.fixture(scope="session")
+def library_app(library_db):
+    return app.create_app({"DATABASE_URL": f"sqlite:///{library_db}"})
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event
+
+import asgi
+
+
+@pytest.fixture
+def asgi_app(library_db):
+    return asgi.create_asgi_app({"DATABASE_URL": f"sqlite:///{library_db}"})
+
+
+async def asgi_get(asgi_app, path, query=""):
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": query.encode(), "headers": [],
+             "http_version": "1.1", "scheme": "http", "server": ("testserver", 80), "client": ("127.0.0.1", 0)}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi_app(scope, receive, send)
+    headers = {name.decode(): value.decode() for name, value in messages[0]["headers"]}
+    return messages[0]["status"], headers
+
+
+def test_cached_views_never_query_on_the_event_loop(asgi_app):
+    blocking = []
+
+    def on_loop_thread(conn, cursor, statement, parameters, context, executemany):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        blocking.append(statement)
+
+    read_engine = asgi_app.flask_app.extensions["db"].read_engine
+    event.listen(read_engine, "before_cursor_execute", on_loop_thread)
+
+    async def requests():
+        try:
+            return [await asgi_get(asgi_app, path, "limit=5")
+                    for path in ("/books", "/books", "/guestWatchList", "/guestWatchList")]
+        finally:
+            await asgi_app.aclose()
+
+    try:
+        responses = asyncio.run(requests())
+    finally:
+        event.remove(read_engine, "before_cursor_execute", on_loop_thread)
+
+    assert [status for status, _ in responses] == [200] * 4
+    # the second request of each view is answered from the cache under the same generation
+    assert responses[0][1]["etag"] == responses[1][1]["etag"]
+    assert responses[2][1]["etag"] == responses[3][1]["etag"]
+    assert blocking == []
+
+
+def test_request_waiting_too_long_for_a_connection_is_shed(library_db):
+    asgi_app = asgi.create_asgi_app({"DATABASE_URL": f"sqlite:///{library_db}", "ASYNC_DB_POOL_SIZE": 1,
+                                     "ASYNC_DB_WAIT_TIMEOUT": 0.05})
+    sessions = asgi_app.flask_app.extensions["async_db"]
+
+    async def requests():
+        try:
+            # hold the only connection, as a slow page would
+            with asgi_app.flask_app.app_context():
+                async with sessions():
+                    shed = await asgi_get(asgi_app, "/books", "limit=5")
+            return shed, await asgi_get(asgi_app, "/books", "limit=5")
+        finally:
+            await asgi_app.aclose()
+
+    (status, headers), (after_status, _) = asyncio.run(requests())
+    assert status == 503
+    assert headers["retry-after"] == str(asgi_app.flask_app.config["ASYNC_DB_RETRY_AFTER"])
+    assert after_status == 200
@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+import app
+
+THREADS = 16
+ROUNDS = 5
+
+
+@pytest.fixture
+def book_and_customer(library_app):
+    with library_app.app_context():
+        db = app.get_db_session(readonly=True)
+        book_id = db.query(app.Book.id).filter(app.Book.active == True, app.Book.isLoaned == False).order_by(app.Book.id).limit(1).scalar()
+        cust_id = db.query(app.Customer.id).filter(app.Customer.active == True).order_by(app.Customer.id).limit(1).scalar()
+        library_app.extensions["db"].remove_sessions()
+    return book_id, cust_id
+
+
+def checkout(client, book_id, cust_id, batch):
+    # "loaned" or "conflict"; the batch endpoint reports a lost race per book in its 200 report,
+    # or as a 409 when the unique index on active loans catches it at commit
+    if batch:
+        response = client.post("/loans/checkout", json={"custId": cust_id, "bookIds": [book_id]})
+        if response.status_code == 200:
+            [result] = response.get_json()["results"]
+            return "loaned" if result.get("status") == "loaned" else result["error"]
+    else:
+        response = client.put("/books", json={"id": book_id, "custId": cust_id})
+        if response.status_code == 200:
+            return "loaned"
+    return "conflict" if response.status_code == 409 else response.status_code
+
+
+def test_concurrent_checkouts_of_one_book_create_one_loan(library_app, book_and_customer):
+    book_id, cust_id = book_and_customer
+    for _ in range(ROUNDS):
+        barrier = threading.Barrier(THREADS)
+        outcomes = []
+        lock = threading.Lock()
+
+        def desk(batch):
+            client = library_app.test_client()
+            barrier.wait()
+            outcome = checkout(client, book_id, cust_id, batch)
+            with lock:
+                outcomes.append(outcome)
+
+        desks = [threading.Thread(target=desk, args=(n % 2 == 0,)) for n in range(THREADS)]
+        for thread in desks:
+            thread.start()
+        for thread in desks:
+            thread.join()
+
+        with library_app.app_context():
+            db = app.get_db_session(readonly=True)
+            active_loans = db.query(app.Loan.id).filter(app.Loan.bookId == book_id, app.Loan.active == True).count()
+            library_app.extensions["db"].remove_sessions()
+        assert outcomes.count("loaned") == 1, outcomes
+        assert all(outcome in ("conflict", "Book is already loaned") for outcome in outcomes if outcome != "loaned"), outcomes
+        assert active_loans == 1
+
+        response = library_app.test_client().post("/loans/return", json={"custId": cust_id, "bookIds": [book_id]})
+        assert response.status_code == 200
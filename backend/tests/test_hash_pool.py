@@ -0,0 +1,58 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def small_pool_app(library_db, library_app):
+    # the hashing pool is process-wide: size it down for this test and put it back afterwards
+    flask_app = app.create_app({"DATABASE_URL": f"sqlite:///{library_db}", "HASH_POOL_WORKERS": 2,
+                                "HASH_POOL_MAX_QUEUE": 2, "BCRYPT_LOG_ROUNDS": 10})
+    yield flask_app
+    app.hash_pool.init_app(library_app)
+
+
+def customer_rows(count):
+    for n in range(count):
+        yield json.dumps({"firstName": "Bulk", "lastName": "Import", "birthDate": "1990-01-01", "city": "Haifa",
+                          "email": f"bulk{n}@example.com", "phoneNumber": f"050-{n:07d}",
+                          "username": f"bulkimport{n}", "password": "Bulk123!"}) + "\n"
+
+
+def test_login_is_served_while_a_bulk_import_hashes(small_pool_app):
+    with small_pool_app.app_context():
+        username = (app.get_db_session(readonly=True).query(app.Customer.username)
+                    .filter(app.Customer.active == True).order_by(app.Customer.id).limit(1).scalar())
+        small_pool_app.extensions["db"].remove_sessions()
+
+    imported = {}
+
+    def run_import():
+        response = small_pool_app.test_client().post("/customers/bulk", data="".join(customer_rows(40)),
+                                                     content_type="application/x-ndjson")
+        imported["status"], imported["report"] = response.status_code, response.get_json()
+
+    def login(_):
+        response = small_pool_app.test_client().post("/login", json={"username": username, "password": "Bench123!"})
+        return response.status_code
+
+    importer = threading.Thread(target=run_import)
+    importer.start()
+    while app.hash_pool.stats()["in_flight"] == 0 and importer.is_alive():
+        time.sleep(0.01)
+
+    # as many concurrent logins as the pool admits: the import must not have taken any of their slots
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        statuses = list(executor.map(login, range(4)))
+    import_was_running = importer.is_alive()
+    importer.join()
+
+    assert import_was_running
+    assert statuses == [200] * 4
+    assert imported["status"] == 200
+    assert imported["report"]["inserted"] == 40
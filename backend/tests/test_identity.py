@@ -0,0 +1,58 @@
+import sqlite3
+import time
+
+import pytest
+from sqlalchemy import event
+
+import app
+
+
+@pytest.fixture
+def manager(library_app, library_db):
+    with library_app.app_context():
+        customer = (app.get_db_session(readonly=True).query(app.Customer.id, app.Customer.username)
+                    .filter(app.Customer.role == "manager", app.Customer.active == True).first())
+        library_app.extensions["db"].remove_sessions()
+    yield customer
+    # restore the role through SQLite directly, like any other writer the trigger covers
+    with sqlite3.connect(library_db) as conn:
+        conn.execute("UPDATE customers SET role = 'manager' WHERE id = ?", (customer.id,))
+
+
+def login(client, username):
+    response = client.post("/login", json={"username": username, "password": "Bench123!"})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.get_json()['access_token']}"}
+
+
+def test_current_token_is_authorized_without_queries(library_app, manager):
+    client = library_app.test_client()
+    headers = login(client, manager.username)
+    assert client.get("/manager", headers=headers).status_code == 200
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    database = library_app.extensions["db"]
+    for engine in (database.engine, database.read_engine):
+        event.listen(engine, "before_cursor_execute", count)
+    try:
+        assert client.get("/manager", headers=headers).status_code == 200
+    finally:
+        for engine in (database.engine, database.read_engine):
+            event.remove(engine, "before_cursor_execute", count)
+    assert statements == []
+
+
+def test_demotion_by_another_writer_revokes_the_token(library_app, library_db, manager, monkeypatch):
+    monkeypatch.setitem(library_app.config, "IDENTITY_VERSION_TTL", 0.05)
+    client = library_app.test_client()
+    headers = login(client, manager.username)
+    assert client.get("/manager", headers=headers).status_code == 200
+
+    with sqlite3.connect(library_db) as conn:
+        conn.execute("UPDATE customers SET role = 'user' WHERE id = ?", (manager.id,))
+    time.sleep(0.1)
+    assert client.get("/manager", headers=headers).status_code == 403
@@ -0,0 +1,17 @@
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize("path", ["/guestWatchList", "/books"])
+def test_list_without_paging_args_returns_the_default_page(library_app, path):
+    client = library_app.test_client()
+    response = client.get(path)
+    assert response.status_code == 200
+    first = response.get_json()
+    assert len(first) == app.DEFAULT_PAGE_LIMIT
+    cursor = response.headers["X-Next-Cursor"]
+
+    following = client.get(path, query_string={"after": cursor}).get_json()
+    assert len(following) == app.DEFAULT_PAGE_LIMIT
+    assert first[-1] != following[0]
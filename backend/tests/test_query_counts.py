@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import event, func
+
+import app
+
+
+@pytest.fixture
+def count_statements(library_app):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    database = library_app.extensions["db"]
+    engines = {database.engine, database.read_engine}
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", count)
+    yield statements
+    for engine in engines:
+        event.remove(engine, "before_cursor_execute", count)
+
+
+def customer_token(library_app, most_loans):
+    with library_app.app_context():
+        db = app.get_db_session(readonly=True)
+        loans = func.count(app.Loan.id)
+        username, loan_count = (db.query(app.Customer.username, loans)
+                                .join(app.Loan, app.Loan.custId == app.Customer.id)
+                                .filter(app.Customer.active == True)
+                                .group_by(app.Customer.id)
+                                .order_by(loans.desc() if most_loans else loans).first())
+        token = app.create_access_token(identity=username)
+        library_app.extensions["db"].remove_sessions()
+    return {"Authorization": f"Bearer {token}"}, loan_count
+
+
+@pytest.mark.parametrize("query", ["", "?active=1", "?limit=5"])
+def test_find_customers_books_runs_a_constant_number_of_queries(library_app, count_statements, query):
+    client = library_app.test_client()
+    counts = {}
+    for most_loans in (True, False):
+        headers, loan_count = customer_token(library_app, most_loans)
+        # the first request also resolves the caller into the identity cache
+        assert client.get(f"/findCustomersBooks{query}", headers=headers).status_code == 200
+        count_statements.clear()
+        response = client.get(f"/findCustomersBooks{query}", headers=headers)
+        assert response.status_code == 200
+        if most_loans and not query:
+            assert len(response.get_json()) == loan_count > 1
+        counts[loan_count] = len(count_statements)
+    heavy, light = max(counts), min(counts)
+    assert heavy > light
+    assert counts[heavy] == counts[light] <= 2, count_statements
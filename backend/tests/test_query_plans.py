@@ -0,0 +1,44 @@
+import pytest
+from sqlalchemy import text
+
+import app
+
+# every partial index over outstanding loans: without them /loans has nothing but the table to walk
+ACTIVE_LOAN_INDEXES = ("ix_loans_active_id", "ix_loans_late_id", "ix_loans_active_expected_returnDate",
+                       "ux_loans_active_bookId")
+
+
+@pytest.mark.parametrize("route", app.EXPLAIN_ROUTES)
+def test_read_endpoint_uses_indexes(library_app, route):
+    with library_app.app_context():
+        [(_, steps)] = app.explain_routes([route])
+    assert steps, f"{route} issued no SELECT"
+    full_scans = [detail for detail, is_scan in steps if is_scan]
+    assert not full_scans, f"{route} scans a whole table: {full_scans}"
+
+
+def test_dropping_a_partial_index_fails_the_check(library_app):
+    engine = library_app.extensions["db"].engine
+    with engine.begin() as conn:
+        for name in ACTIVE_LOAN_INDEXES:
+            conn.execute(text(f"DROP INDEX {name}"))
+    try:
+        with library_app.app_context():
+            [(_, steps)] = app.explain_routes(["/loans?limit=100"])
+        assert ("SCAN loans", True) in steps
+    finally:
+        app.migrate_indexes(engine)
+        with engine.begin() as conn:
+            for name in ACTIVE_LOAN_INDEXES:
+                conn.execute(text(f"ANALYZE {name}"))
+
+
+def test_only_an_unfiltered_rowid_walk_is_bounded_by_its_limit():
+    assert app.is_full_scan("SCAN books", "SELECT id FROM books WHERE active", ["SCAN books"])
+    assert app.is_full_scan("SCAN books", "SELECT id FROM books ORDER BY name LIMIT 10",
+                            ["SCAN books", "USE TEMP B-TREE FOR ORDER BY"])
+    assert app.is_full_scan("SCAN books", "SELECT id FROM books WHERE active ORDER BY id LIMIT 101", ["SCAN books"])
+    assert not app.is_full_scan("SCAN books", "SELECT id FROM books ORDER BY id LIMIT 101", ["SCAN books"])
+    assert not app.is_full_scan("SEARCH books USING INDEX ix_books_active_pages (active=?)",
+                                "SELECT id FROM books WHERE active ORDER BY id LIMIT 101",
+                                ["SEARCH books USING INDEX ix_books_active_pages (active=?)"])
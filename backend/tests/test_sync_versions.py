@@ -0,0 +1,36 @@
+import app
+
+
+def counter_values(library_app, *names):
+    with library_app.app_context():
+        db = app.get_db_session(readonly=True)
+        values = dict(db.query(app.Counter.name, app.Counter.value).filter(app.Counter.name.in_(names)))
+        library_app.extensions["db"].remove_sessions()
+    return values
+
+
+def test_sweep_that_changes_nothing_keeps_the_versions(library_app):
+    names = ("sync_version", "catalog_version")
+    with library_app.app_context():
+        app.sweep_overdue_loans()
+        before = counter_values(library_app, *names)
+        # the same day again: every overdue loan already carries these values
+        app.sweep_overdue_loans()
+    assert counter_values(library_app, *names) == before
+
+
+def test_rewriting_a_row_with_its_own_values_keeps_the_versions(library_app):
+    names = ("sync_version", "catalog_version")
+    before = counter_values(library_app, *names)
+    with library_app.app_context():
+        db = app.get_db_session()
+        db.query(app.Book).filter(app.Book.id == 1).update({app.Book.name: app.Book.name}, synchronize_session=False)
+        db.commit()
+        library_app.extensions["db"].remove_sessions()
+    assert counter_values(library_app, *names) == before
+
+
+def test_repeated_sweep_rewrites_no_rows(library_app):
+    with library_app.app_context():
+        app.sweep_overdue_loans()
+        assert app.sweep_overdue_loans() == 0
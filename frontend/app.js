@@ -1,5 +1,57 @@
 const apiUrl = 'http://127.0.0.1:5000'
-function fetchBooks() {
+const PAGE_SIZE = 50;
+const nextCursors = {};
+let liveUpdates = false;
+
+function pageParams(key, append) {
+  const params = { limit: PAGE_SIZE };
+  if (append && nextCursors[key]) params.after = nextCursors[key];
+  return params;
+}
+
+function updateMoreButton(key, response) {
+  setMoreButton(key, response.headers['x-next-cursor']);
+}
+
+function setMoreButton(key, cursor) {
+  nextCursors[key] = cursor;
+  const button = document.getElementById(`${key}-more-button`);
+  if (button) button.style.display = nextCursors[key] ? 'inline' : 'none';
+}
+
+function renderBooks(books, append = false) {
+  const booksTableBody = document.querySelector('#books-table tbody');
+  if (!append) booksTableBody.innerHTML = '';
+  if (books.length === 0 && !append) {
+    const row = document.createElement('tr');
+    row.innerHTML = `<td colspan="6" style="text-align: center;">No books found</td>`;
+    booksTableBody.appendChild(row);
+  } else {
+
+    books.forEach(book => {
+      const row = document.createElement('tr');
+      row.dataset.id = book.id;
+      row.innerHTML = `
+        <td>${book.id}</td>
+        <td>${book.name}</td>
+        <td>${book.author}</td>
+        <td>${book.publishYear}</td>
+        <td>${book.isLoaned ? 'Yes' : 'No'}</td>
+        <td>
+          <button class="loan-button" onclick="loanBook(${book.id}, ${book.isLoaned})">
+            Loan
+          </button>
+          <button class="loan-button" onclick="deleteBook(${book.id})">
+            Delete
+          </button>
+        </td>
+      `;
+      booksTableBody.appendChild(row);
+    });
+  }
+}
+
+function fetchBooks(append = false) {
 
   const name = document.getElementById('S-book-name').value;
   const author = document.getElementById('S-book-author').value;
@@ -11,42 +63,16 @@ function fetchBooks() {
   if (publishYear) searchParams.publishYear = publishYear;
 
   let url = `${apiUrl}/books`;
+  let params = pageParams('books', append);
   if (Object.keys(searchParams).length > 0) {
     url = `${apiUrl}/findBook`;
+    params = searchParams;
   }
 
-  axios.get(url, { params: searchParams })
+  axios.get(url, { params: params })
     .then(response => {
-      const books = response.data;
-      const booksTableBody = document.querySelector('#books-table tbody');
-      booksTableBody.innerHTML = '';
-
-      if (books.length === 0) {
-        const row = document.createElement('tr');
-        row.innerHTML = `<td colspan="6" style="text-align: center;">No books found</td>`;
-        booksTableBody.appendChild(row);
-      } else {
-
-        books.forEach(book => {
-          const row = document.createElement('tr');
-          row.innerHTML = `
-            <td>${book.id}</td>
-            <td>${book.name}</td>
-            <td>${book.author}</td>
-            <td>${book.publishYear}</td>
-            <td>${book.isLoaned ? 'Yes' : 'No'}</td>
-            <td>
-              <button class="loan-button" onclick="loanBook(${book.id}, ${book.isLoaned})">
-                Loan
-              </button>
-              <button class="loan-button" onclick="deleteBook(${book.id})">
-                Delete
-              </button>
-            </td>
-          `;
-          booksTableBody.appendChild(row);
-        });
-      }
+      renderBooks(response.data, append);
+      updateMoreButton('books', response);
     })
     .catch(error => {
       console.error('Error fetching books data:', error);
@@ -117,10 +143,17 @@ const loanBook = (id, isLoaned) => {
   })
     .then(response => {
       console.log("loan updated:", response.data);
-      fetchBooks();
-      fetchLoans();
+      if (!liveUpdates) {
+        fetchBooks();
+        fetchLoans();
+      }
     })
     .catch(error => {
+      if (error.response && error.response.status === 409) {
+        alert('This book is already loaned.');
+        fetchBooks();
+        return;
+      }
       console.error("Error updating a loan:", error);
       alert("Error updating loan. Please try again.");
     })
@@ -131,12 +164,46 @@ function deleteBook(bookId) {
   axios.delete(`${apiUrl}/books`, { data: { id: bookId } })
     .then(response => {
       alert(response.data.message);
-      fetchBooks();
+      if (!liveUpdates) fetchBooks();
     })
     .catch(error => console.error('Error deleting book:', error));
 }
 
-function fetchCustomers() {
+function renderCustomers(customers, append = false) {
+  const customersTableBody = document.querySelector('#customers-table tbody');
+  if (!append) customersTableBody.innerHTML = '';
+  if (customers.length === 0 && !append) {
+    const row = document.createElement('tr');
+    row.innerHTML = `<td colspan="8" style="text-align: center;">No customers found</td>`;
+    customersTableBody.appendChild(row);
+  } else {
+
+    customers.forEach(customer => {
+      const row = document.createElement('tr');
+      row.innerHTML = `
+        <td>${customer.id}</td>
+        <td>${customer.firstName}</td>
+        <td>${customer.lastName}</td>
+        <td>${customer.age}</td>
+        <td>${customer.city}</td>
+        <td>${customer.email}</td>
+        <td>${customer.phoneNumber}</td>
+        <td>${customer.username}</td>
+        <td>
+          <button class="loan-button" onclick="deleteCustomer(${customer.id})">
+            Delete
+          </button>
+          <button class="loan-button" onclick="updateCustomer(${customer.id})">
+            Update
+          </button>
+        </td>
+      `;
+      customersTableBody.appendChild(row);
+    });
+  }
+}
+
+function fetchCustomers(append = false) {
 
   const firstName = document.getElementById('customer-first-name').value;
   const lastName = document.getElementById('customer-last-name').value;
@@ -160,47 +227,17 @@ function fetchCustomers() {
 
 
   let url = `${apiUrl}/customers`;
+  let params = pageParams('customers', append);
   if (Object.keys(searchParams).length > 0) {
     url = `${apiUrl}/findCustomer`
+    params = searchParams;
   }
 
 
-  axios.get(url, { params: searchParams })
+  axios.get(url, { params: params })
     .then(response => {
-      const customers = response.data;
-      const customersTableBody = document.querySelector('#customers-table tbody');
-      customersTableBody.innerHTML = ''; 
-
-     
-      if (customers.length === 0) {
-        const row = document.createElement('tr');
-        row.innerHTML = `<td colspan="8" style="text-align: center;">No customers found</td>`;
-        customersTableBody.appendChild(row);
-      } else {
-
-        customers.forEach(customer => {
-          const row = document.createElement('tr');
-          row.innerHTML = `
-            <td>${customer.id}</td>
-            <td>${customer.firstName}</td>
-            <td>${customer.lastName}</td>
-            <td>${customer.age}</td>
-            <td>${customer.city}</td>
-            <td>${customer.email}</td>
-            <td>${customer.phoneNumber}</td>
-            <td>${customer.username}</td>
-            <td>
-              <button class="loan-button" onclick="deleteCustomer(${customer.id})">
-                Delete
-              </button>
-              <button class="loan-button" onclick="updateCustomer(${customer.id})">
-                Update
-              </button>
-            </td>
-          `;
-          customersTableBody.appendChild(row);
-        });
-      }
+      renderCustomers(response.data, append);
+      updateMoreButton('customers', response);
     })
     .catch(error => {
       console.error('Error fetching customers data:', error);
@@ -390,58 +427,67 @@ function closeUpdateModal() {
 
 
 
-function fetchLoans() {
-  axios.get(`${apiUrl}/loans`)
-    .then(response => {
-      const loans = response.data;
-      const loansTableBody = document.querySelector('#loans-table tbody');
-      loansTableBody.innerHTML = '';
+function loanRow(loan) {
+  const row = document.createElement('tr');
+  row.dataset.id = loan.id;
+  row.innerHTML = `
+          <td>${loan.id}</td>
+          <td>${loan.bookId}</td>
+          <td>${loan.custId}</td>
+          <td>${loan.loanDate}</td>
+          <td>${loan.expected_returnDate}</td>
+          <td>
+                <button class="return-button" onclick="returnBook(${loan.id})">
+                  return
+                </button>
+          </td>
+        `;
+  return row;
+}
 
-      
-      loans.forEach(loan => {
-        const row = document.createElement('tr');
-        row.innerHTML = `
-              <td>${loan.id}</td>
-              <td>${loan.bookId}</td>
-              <td>${loan.custId}</td>
-              <td>${loan.loanDate}</td>
-              <td>${loan.expected_returnDate}</td>
-              <td>
-                    <button class="return-button" onclick="returnBook(${loan.id})">
-                      return
-                    </button>
-              </td>
-            `;
-        loansTableBody.appendChild(row);
-      });
+function renderLoans(loans, append = false) {
+  const loansTableBody = document.querySelector('#loans-table tbody');
+  if (!append) loansTableBody.innerHTML = '';
+  loans.forEach(loan => loansTableBody.appendChild(loanRow(loan)));
+}
+
+function fetchLoans(append = false) {
+  axios.get(`${apiUrl}/loans`, { params: pageParams('loans', append) })
+    .then(response => {
+      renderLoans(response.data, append);
+      updateMoreButton('loans', response);
     })
     .catch(error => console.error('Error fetching loans data:', error));
 }
 
-function fetchLateLoans() {
-  axios.get(`${apiUrl}/lateLoans`)
+function renderLateLoans(lateLoans, append = false) {
+  const lateLoansTableBody = document.querySelector('#late-loans-table tbody');
+  if (!append) lateLoansTableBody.innerHTML = '';
+  lateLoans.forEach(loan => {
+    const row = document.createElement('tr');
+    row.dataset.id = loan.id;
+    row.innerHTML = `
+          <td>${loan.id}</td>
+          <td>${loan.custId}</td>
+          <td>${loan.bookId}</td>
+          <td>${loan.loanDate}</td>
+          <td>${loan.expected_returnDate}</td>
+          <td>${loan.lateDays_num}</td>
+          <td>
+            <button class="return-button" onclick="returnBook(${loan.id})">
+              Return
+            </button>
+          </td>
+        `;
+    lateLoansTableBody.appendChild(row);
+  });
+}
+
+function fetchLateLoans(append = false) {
+  axios.get(`${apiUrl}/lateLoans`, { params: pageParams('lateLoans', append) })
     .then(response => {
-      const lateLoans = response.data;
-      const lateLoansTableBody = document.querySelector('#late-loans-table tbody');
-      lateLoansTableBody.innerHTML = '';
-
-      lateLoans.forEach(loan => {
-        const row = document.createElement('tr');
-        row.innerHTML = `
-              <td>${loan.id}</td>
-              <td>${loan.customerId}</td>
-              <td>${loan.bookId}</td>
-              <td>${loan.loanDate}</td>
-              <td>${loan.expected_returnDate}</td>
-              <td>${loan.lateDays_num}</td>
-              <td>
-                <button class="return-button" onclick="returnBook(${loan.id})">
-                  Return
-                </button>
-              </td>
-            `;
-        lateLoansTableBody.appendChild(row);
-      });
+      renderLateLoans(response.data, append);
+      updateMoreButton('lateLoans', response);
     })
     .catch(error => console.error('Error fetching late loans data:', error));
 }
@@ -453,8 +499,7 @@ function returnBook(loanId) {
     .then(response => {
       console.log('Book returned successfully:', response.data);
       alert('Book returned successfully');
-      fetchLoans();
-      fetchLateLoans();
+      if (!liveUpdates) loadDashboard();
     })
     .catch(error => {
       console.error('Error returning book:', error.response || error);
@@ -518,9 +563,75 @@ function register() {
 
 
 
+function renderCounts(counts) {
+  document.getElementById('count-books').innerText = counts.books;
+  document.getElementById('count-loaned').innerText = counts.loaned;
+  document.getElementById('count-overdue').innerText = counts.overdue;
+  document.getElementById('count-customers').innerText = counts.activeCustomers;
+}
+
+function loadDashboard() {
+  // first page of every table plus the counts in a single request
+  axios.get(`${apiUrl}/dashboard`, { params: { limit: PAGE_SIZE } })
+    .then(response => {
+      const dashboard = response.data;
+      renderBooks(dashboard.books.items);
+      setMoreButton('books', dashboard.books.nextCursor);
+      renderCustomers(dashboard.customers.items);
+      setMoreButton('customers', dashboard.customers.nextCursor);
+      renderLoans(dashboard.loans.items);
+      setMoreButton('loans', dashboard.loans.nextCursor);
+      renderLateLoans(dashboard.lateLoans.items);
+      setMoreButton('lateLoans', dashboard.lateLoans.nextCursor);
+      renderCounts(dashboard.counts);
+    })
+    .catch(error => console.error('Error fetching dashboard data:', error));
+}
+
+function removeRow(tableId, id) {
+  const row = document.querySelector(`#${tableId} tbody tr[data-id="${id}"]`);
+  if (row) row.remove();
+}
+
+function subscribeToEvents() {
+  // checkouts and returns from every desk are pushed here, so the tables are patched in place
+  if (!window.EventSource) return;
+  const events = new EventSource(`${apiUrl}/events`);
+  events.onopen = () => { liveUpdates = true; };
+  events.onerror = () => { liveUpdates = false; };
+
+  events.addEventListener('book.availability', event => {
+    const book = JSON.parse(event.data);
+    const row = document.querySelector(`#books-table tbody tr[data-id="${book.id}"]`);
+    if (!row) return;
+    row.cells[4].innerText = book.isLoaned ? 'Yes' : 'No';
+    row.querySelector('.loan-button').setAttribute('onclick', `loanBook(${book.id}, ${book.isLoaned})`);
+  });
+  events.addEventListener('book.deleted', event => {
+    removeRow('books-table', JSON.parse(event.data).id);
+  });
+  events.addEventListener('loan.checkout', event => {
+    const loan = JSON.parse(event.data);
+    // the table is ordered by id, so a new loan only belongs on screen once the last page is loaded
+    if (!nextCursors.loans && !document.querySelector(`#loans-table tbody tr[data-id="${loan.id}"]`)) {
+      document.querySelector('#loans-table tbody').appendChild(loanRow(loan));
+    }
+  });
+  events.addEventListener('loan.return', event => {
+    const loan = JSON.parse(event.data);
+    removeRow('loans-table', loan.id);
+    removeRow('late-loans-table', loan.id);
+  });
+  events.addEventListener('resync', () => {
+    // we fell behind and missed events: reload everything and start a fresh stream
+    events.close();
+    liveUpdates = false;
+    loadDashboard();
+    subscribeToEvents();
+  });
+}
+
 window.onload = function () {
-  fetchBooks();
-  fetchCustomers();
-  fetchLoans();
-  fetchLateLoans();
+  loadDashboard();
+  subscribeToEvents();
 }
\ No newline at end of file